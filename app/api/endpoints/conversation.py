@@ -1,9 +1,12 @@
 import logging
+from typing import Annotated
 
 from sse_starlette.sse import EventSourceResponse
-from fastapi import APIRouter
+from fastapi import APIRouter, Header, HTTPException, status
 
+from app.core.config import settings
 from app.chat.messaging import handle_chat_message
+from app.core.profiling import start_request_profiler
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +16,8 @@ router = APIRouter()
 @router.get("/message")
 async def message_conversation(
     user_message: str,
+    x_collection: Annotated[str | None, Header()] = None,
+    x_profile_token: Annotated[str | None, Header()] = None,
 ) -> EventSourceResponse:
     """
     Send a message from a user to a conversation, receive a SSE stream of the assistant's response.
@@ -20,10 +25,44 @@ async def message_conversation(
     the message object's sub_processes list and content string is appended to. While the message is being
     generated, the status of the message will be PENDING. Once the message is generated, the status will
     be SUCCESS. If there was an error in processing the message, the final status will be ERROR.
+
+    The X-Collection header selects the FAQ corpus, the default one otherwise.
+    Sending the X-Profile-Token header with the configured token profiles the request.
+    """
+    return _stream_chat_message(
+        user_message, x_collection or settings.COLLECTION_NAME, x_profile_token
+    )
+
+
+@router.get("/{collection_name}/message")
+async def message_collection_conversation(
+    collection_name: str,
+    user_message: str,
+    x_profile_token: Annotated[str | None, Header()] = None,
+) -> EventSourceResponse:
+    """
+    Same as `/message`, for the FAQ corpus selected by the path.
     """
+    return _stream_chat_message(user_message, collection_name, x_profile_token)
+
+
+def _stream_chat_message(
+    user_message: str, collection_name: str, profile_token: str | None
+) -> EventSourceResponse:
+    if collection_name not in settings.CORPORA:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Collection {collection_name} not found",
+        )
 
     async def event_publisher():
-        async for text in handle_chat_message(user_message):
-            yield text
+        # started here to profile on the thread that streams the response
+        profiler = start_request_profiler(profile_token)
+        try:
+            async for text in handle_chat_message(user_message, collection_name):
+                yield text
+        finally:
+            if profiler is not None:
+                profiler.stop()
 
     return EventSourceResponse(event_publisher())
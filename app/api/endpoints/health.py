@@ -2,13 +2,22 @@ from typing import Dict
 
 from fastapi import APIRouter
 
+from app.chat.index_manager import index_manager
+from app.chat.speculative import get_hit_rate
+
 
 router = APIRouter()
 
 
 @router.get("/")
-async def health() -> Dict[str, str]:
+async def health() -> Dict[str, str | float | list[str] | None]:
     """
-    Health check endpoint.
+    Health check endpoint. Reports the index version the worker serves, its loaded collections
+    and the hit rate of its speculative retrieval.
     """
-    return {"status": "alive"}
+    return {
+        "status": "alive",
+        "index_version": index_manager.version,
+        "loaded_collections": index_manager.collection_names,
+        "speculative_retrieval_hit_rate": get_hit_rate(),
+    }
@@ -1,49 +1,60 @@
+import asyncio
 import logging
 import os
+from functools import lru_cache
 
 import chromadb
+from chromadb.api import ClientAPI
+from chromadb.api.client import SharedSystemClient
 from llama_index.core import VectorStoreIndex, ServiceContext
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.retrievers import BaseRetriever
 from llama_index.core.tools import QueryEngineTool, ToolMetadata
-from llama_index.embeddings.openai import (
-    OpenAIEmbedding,
-    OpenAIEmbeddingMode,
-    OpenAIEmbeddingModelType,
-)
+from llama_index.core.vector_stores.types import VectorStoreQuery, VectorStoreQueryResult
 from llama_index.vector_stores.chroma import ChromaVectorStore
 from llama_index.core.query_engine import RetrieverQueryEngine
 from llama_index.llms.openai import OpenAI
 from llama_index_client import SentenceSplitter
 from llama_index.agent.openai import OpenAIAgent
 
-from app.core.config import settings
+from app.core.config import IndexFormat, settings
+from app.core.embedding import check_embedding_metadata, get_embed_model
 from app.chat.system_message import SYSTEM_MESSAGE
 from app.chat.qa_response_synth import get_custom_response_synth
+from app.data.snapshot import Snapshot, SnapshotVectorStore, get_snapshot_path
 
 logger = logging.getLogger(__name__)
 
+_chroma_clients: dict[str, ClientAPI] = {}
 
-def get_chat_engine() -> OpenAIAgent:
-    index = _load_index_from_db(settings.DB_PATH)
 
+class ThreadedChromaVectorStore(ChromaVectorStore):
+    """
+    ChromaVectorStore whose async query runs off the event loop. The base class runs the
+    blocking query on the loop, which stalls every other request during the search.
+    """
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ThreadedChromaVectorStore"
+
+    async def aquery(self, query: VectorStoreQuery, **kwargs) -> VectorStoreQueryResult:
+        return await asyncio.to_thread(self.query, query, **kwargs)
+
+
+def get_chat_engine(retriever: BaseRetriever) -> OpenAIAgent:
     query_engine_tool = QueryEngineTool(
-        query_engine=_index_to_query_engine(index),
+        query_engine=_retriever_to_query_engine(retriever),
         metadata=ToolMetadata(
             name="naver_smart_store_faq",
             description="A tool for querying the Naver Smart Store FAQ.",
         ),
     )
 
-    llm = OpenAI(
-        temperature=0,
-        model="gpt-3.5-turbo",
-        streaming=True,
-        api_key=settings.OPENAI_API_KEY,
-    )
-
     # note: OpenAIAgent uses ChatMemoryBuffer
     chat_engine = OpenAIAgent.from_tools(
         tools=[query_engine_tool],
-        llm=llm,
+        llm=_get_llm(),
         verbose=settings.VERBOSE,
         system_prompt=SYSTEM_MESSAGE,
     )
@@ -51,50 +62,128 @@ def get_chat_engine() -> OpenAIAgent:
     return chat_engine
 
 
-def _load_index_from_db(db_path: str) -> VectorStoreIndex:
+def load_index_from_db(
+    db_path: str, collection_name: str, warm_up: bool = False
+) -> VectorStoreIndex:
     """
-    Load the index from the database located at the given path.
+    Load the index of a collection from the database located at the given path.
 
     Args:
         db_path (str): The path to the database.
+        collection_name (str): The name of the collection.
+        warm_up (bool): Whether to run a query so that the vector index is in memory
+            before the first request.
 
     Returns:
         VectorStoreIndex: The loaded index from the database.
 
     Raises:
-        ValueError: If the database is not found at the specified path.
+        ValueError: If the database is not found at the specified path,
+            or if it was built with another embedding model.
     """
     if not os.path.exists(db_path):
         raise ValueError(f"Database not found at {db_path}")
 
-    db = chromadb.PersistentClient(path=db_path)
-    chroma_collection = db.get_collection(settings.COLLECTION_NAME)
-
-    vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
+    embed_model = get_embed_model()
 
-    embed_model = OpenAIEmbedding(
-        mode=OpenAIEmbeddingMode.SIMILARITY_MODE,
-        model_type=OpenAIEmbeddingModelType.TEXT_EMBED_ADA_002,
-        api_key=settings.OPENAI_API_KEY,
-    )
+    if settings.INDEX_FORMAT == IndexFormat.SNAPSHOT:
+        vector_store = _load_snapshot_vector_store(db_path, collection_name, embed_model, warm_up)
+    else:
+        vector_store = _load_chroma_vector_store(db_path, collection_name, embed_model, warm_up)
 
     index = VectorStoreIndex.from_vector_store(vector_store, embed_model=embed_model)
 
     return index
 
 
-def _index_to_query_engine(index: VectorStoreIndex) -> RetrieverQueryEngine:
+def estimate_index_bytes(index: VectorStoreIndex) -> int:
+    """
+    Estimate the memory a loaded index keeps resident, and that dropping it frees.
+
+    A Chroma index only wraps a collection whose vector index lives in the segment cache of the
+    shared client, which Chroma bounds and evicts itself, so it counts as nothing here.
+    """
+    vector_store = index.vector_store
+
+    if isinstance(vector_store, SnapshotVectorStore):
+        snapshot = vector_store.client
+        # int8 codes plus a scale and a norm per vector; the rest is paged in on demand
+        return snapshot.count * (snapshot.dimension + 8)
+
+    return 0
+
+
+def _get_chroma_client(db_path: str) -> ClientAPI:
+    # one client per database, shared by all of its collections
+    if db_path not in _chroma_clients:
+        _chroma_clients[db_path] = chromadb.PersistentClient(
+            path=db_path,
+            settings=chromadb.Settings(
+                # evict the vector indexes of idle collections beyond the budget
+                chroma_segment_cache_policy="LRU",
+                chroma_memory_limit_bytes=settings.COLLECTION_MEMORY_BUDGET_BYTES,
+            ),
+        )
+    return _chroma_clients[db_path]
+
+
+def _load_chroma_vector_store(
+    db_path: str, collection_name: str, embed_model: BaseEmbedding, warm_up: bool
+) -> ThreadedChromaVectorStore:
+    db = _get_chroma_client(db_path)
+    chroma_collection = db.get_collection(collection_name)
+
+    check_embedding_metadata(chroma_collection.metadata, embed_model)
+
+    if warm_up:
+        # query with a stored embedding, which does not call the embedding model
+        embeddings = chroma_collection.peek(1)["embeddings"]
+        if embeddings:
+            chroma_collection.query(query_embeddings=embeddings, n_results=settings.TOP_K)
+
+    return ThreadedChromaVectorStore(chroma_collection=chroma_collection)
+
+
+def _load_snapshot_vector_store(
+    db_path: str, collection_name: str, embed_model: BaseEmbedding, warm_up: bool
+) -> SnapshotVectorStore:
+    snapshot_path = get_snapshot_path(db_path, collection_name)
+    if not os.path.exists(snapshot_path):
+        raise ValueError(f"Snapshot not found at {snapshot_path}, rebuild the index")
+
+    snapshot = Snapshot(snapshot_path)
+
+    check_embedding_metadata(snapshot.collection_metadata, embed_model)
+
+    if warm_up and snapshot.count > 0:
+        # page in the int8 codes, which every search reads
+        snapshot.search(snapshot.get_vectors()[0], settings.TOP_K, settings.TOP_K)
+
+    return SnapshotVectorStore(snapshot, rescore_factor=settings.SNAPSHOT_RESCORE_FACTOR)
+
+
+def release_db(db_path: str) -> None:
+    """
+    Release the resources Chroma keeps for the database located at the given path.
     """
-    Converts a VectorStoreIndex to a RetrieverQueryEngine.
+    _chroma_clients.pop(db_path, None)
+
+    # Chroma caches one system per path for the lifetime of the process
+    system = SharedSystemClient._identifer_to_system.pop(db_path, None)
+    if system is not None:
+        system.stop()
+
+
+def _retriever_to_query_engine(retriever: BaseRetriever) -> RetrieverQueryEngine:
+    """
+    Converts a retriever to a RetrieverQueryEngine.
 
     Args:
-        index (VectorStoreIndex): The VectorStoreIndex to convert.
+        retriever (BaseRetriever): The retriever over the index.
 
     Returns:
         RetrieverQueryEngine: The converted RetrieverQueryEngine object.
     """
-    retriever = index.as_retriever(similarity_top_k=settings.TOP_K)
-
     tool_service_context = _get_tool_service_context()
 
     response_synthesizer = get_custom_response_synth(service_context=tool_service_context)
@@ -107,6 +196,18 @@ def _index_to_query_engine(index: VectorStoreIndex) -> RetrieverQueryEngine:
     )
 
 
+@lru_cache(maxsize=1)
+def _get_llm() -> OpenAI:
+    # shared by all requests and collections, so that they reuse one HTTP connection pool
+    return OpenAI(
+        temperature=0,
+        model="gpt-3.5-turbo",
+        streaming=True,
+        api_key=settings.OPENAI_API_KEY,
+    )
+
+
+@lru_cache(maxsize=1)
 def _get_tool_service_context() -> ServiceContext:
     """
     Retrieves the service context for the tool.
@@ -114,18 +215,9 @@ def _get_tool_service_context() -> ServiceContext:
     Returns:
         ServiceContext: The service context object containing the necessary tools for the chat engine.
     """
-    llm = OpenAI(
-        temperature=0,
-        model="gpt-3.5-turbo",
-        streaming=True,
-        api_key=settings.OPENAI_API_KEY,
-    )
+    llm = _get_llm()
 
-    embedding_model = OpenAIEmbedding(
-        mode=OpenAIEmbeddingMode.SIMILARITY_MODE,
-        model_type=OpenAIEmbeddingModelType.TEXT_EMBED_ADA_002,
-        api_key=settings.OPENAI_API_KEY,
-    )
+    embedding_model = get_embed_model()
 
     # Use a smaller chunk size to retrieve more granular results
     node_parser = SentenceSplitter(
@@ -0,0 +1,194 @@
+import asyncio
+import logging
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from llama_index.core import VectorStoreIndex
+
+from app.core.config import settings
+from app.chat.engine import estimate_index_bytes, load_index_from_db, release_db
+from app.data.versions import (
+    get_current_version,
+    get_version_path,
+    register_worker_versions,
+    remove_unused_versions,
+    unregister_worker,
+)
+
+logger = logging.getLogger(__name__)
+
+# (index version, collection name)
+IndexKey = tuple[str, str]
+
+
+class IndexManager:
+    """
+    Serves the collections of the current index version of a worker, and hot-swaps the version
+    when a new one is built.
+
+    Collections are loaded lazily on their first request, and the least recently used idle ones
+    are evicted once their estimated memory exceeds the budget. Only snapshots count towards the
+    budget, since Chroma evicts the vector indexes of its collections itself under the same limit.
+    Requests lease their collection for their whole lifetime, so in-flight requests finish on
+    the version they started with.
+    A retired version is released once its last request is done.
+    """
+
+    def __init__(self, db_path: str, memory_budget_bytes: int):
+        self._db_path = db_path
+        self._memory_budget_bytes = memory_budget_bytes
+        self._version: str | None = None
+        # least recently used first
+        self._indexes: OrderedDict[IndexKey, tuple[VectorStoreIndex, int]] = OrderedDict()
+        self._loading: dict[IndexKey, asyncio.Task] = {}
+        self._leases: Counter[IndexKey] = Counter()
+        self._registered_versions: set[str] = set()
+
+    @property
+    def version(self) -> str | None:
+        return self._version
+
+    @property
+    def collection_names(self) -> list[str]:
+        return [name for version, name in self._indexes if version == self._version]
+
+    def load(self) -> None:
+        """
+        Select the current version. Its collections are loaded on demand.
+
+        Raises:
+            ValueError: If no index has been built.
+        """
+        version = get_current_version(self._db_path)
+        if version is None:
+            raise ValueError(f"Database not found at {self._db_path}")
+
+        self._version = version
+        self._register_versions(self._get_versions_in_use())
+        logger.info(f"Serving the index version {version}")
+
+    async def preload(self, collection_name: str) -> None:
+        if self._version is None:
+            await asyncio.to_thread(self.load)
+        await self._get_index((self._version, collection_name))
+
+    @asynccontextmanager
+    async def lease(self, collection_name: str) -> AsyncIterator[tuple[str, VectorStoreIndex]]:
+        """
+        Yields the version and the index the request is pinned to. The current version may
+        change while the index loads, so the request must use this version, not `version`.
+        """
+        if self._version is None:
+            await asyncio.to_thread(self.load)
+
+        key = (self._version, collection_name)
+        self._leases[key] += 1
+        try:
+            yield key[0], await self._get_index(key)
+        finally:
+            self._leases[key] -= 1
+
+    async def watch(self, interval: float) -> None:
+        """
+        Poll for a new current version. The collections loaded from the old version are loaded
+        and warmed from the new one off the event loop before it is swapped in.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                version = await asyncio.to_thread(get_current_version, self._db_path)
+                if version is not None and version != self._version:
+                    logger.info(f"Found the new index version {version}")
+                    await asyncio.gather(
+                        *[self._get_index((version, name)) for name in self.collection_names]
+                    )
+                    # a single assignment on the event loop, so a request sees either version
+                    self._version = version
+                    self._register_versions(self._get_versions_in_use())
+                    logger.info(f"Serving the index version {version}")
+
+                await self._release_drained_versions()
+            except Exception:
+                logger.exception("Failed to hot-swap the index")
+
+    def close(self) -> None:
+        unregister_worker(self._db_path)
+
+    async def _get_index(self, key: IndexKey) -> VectorStoreIndex:
+        # an index that is not leased can be evicted by another load while this one waits
+        while key not in self._indexes:
+            # concurrent requests for a collection share one load
+            if key not in self._loading:
+                self._loading[key] = asyncio.create_task(self._load_index(key))
+                if key[0] not in self._registered_versions:
+                    # before loading, so that a concurrent build does not remove the version
+                    self._register_versions(self._get_versions_in_use())
+            await asyncio.shield(self._loading[key])
+
+        self._indexes.move_to_end(key)
+        return self._indexes[key][0]
+
+    async def _load_index(self, key: IndexKey) -> None:
+        version, collection_name = key
+        try:
+            index = await asyncio.to_thread(
+                load_index_from_db,
+                get_version_path(self._db_path, version),
+                collection_name,
+                warm_up=True,
+            )
+            self._indexes[key] = (index, estimate_index_bytes(index))
+            logger.info(f"Loaded the collection {collection_name} of the index version {version}")
+        finally:
+            del self._loading[key]
+
+        self._evict_idle_indexes(keep=key)
+
+    def _evict_idle_indexes(self, keep: IndexKey) -> None:
+        total_bytes = sum(num_bytes for _, num_bytes in self._indexes.values())
+
+        for key in list(self._indexes):
+            if total_bytes <= self._memory_budget_bytes:
+                break
+            if key == keep or self._leases[key] > 0:
+                continue
+
+            _, num_bytes = self._indexes.pop(key)
+            total_bytes -= num_bytes
+            logger.info(f"Evicted the idle collection {key[1]} of the index version {key[0]}")
+
+    async def _release_drained_versions(self) -> None:
+        for key in list(self._leases):
+            if key[0] != self._version and self._leases[key] == 0:
+                del self._leases[key]
+        for key in list(self._indexes):
+            if key[0] != self._version and key not in self._leases and key not in self._loading:
+                del self._indexes[key]
+
+        versions_in_use = self._get_versions_in_use()
+        retired_versions = self._registered_versions - versions_in_use
+        if not retired_versions:
+            return
+
+        for version in retired_versions:
+            await asyncio.to_thread(release_db, get_version_path(self._db_path, version))
+            logger.info(f"Released the index version {version}")
+
+        self._register_versions(versions_in_use)
+        await asyncio.to_thread(remove_unused_versions, self._db_path)
+
+    def _register_versions(self, versions: set[str]) -> None:
+        register_worker_versions(self._db_path, versions)
+        self._registered_versions = versions
+
+    def _get_versions_in_use(self) -> set[str]:
+        return {
+            self._version,
+            *(version for version, _ in self._indexes),
+            *(version for version, _ in self._loading),
+            *(version for (version, _), count in self._leases.items() if count > 0),
+        } - {None}
+
+
+index_manager = IndexManager(settings.DB_PATH, settings.COLLECTION_MEMORY_BUDGET_BYTES)
@@ -1,26 +1,96 @@
+import asyncio
 import logging
+import time
 from typing import AsyncGenerator
 
 from llama_index.core.chat_engine.types import StreamingAgentChatResponse
 
+from app.core.config import settings
 from app.chat.engine import get_chat_engine
+from app.chat.index_manager import index_manager
+from app.chat.query_log import log_query
+from app.chat.precomputed import find_precomputed_answer, load_precomputed_answers
+from app.chat.speculative import SpeculativeRetriever
 
 
 logger = logging.getLogger(__name__)
 
 
-async def handle_chat_message(user_message: str) -> AsyncGenerator[str, None]:
-    chat_engine = get_chat_engine()
-    logger.debug("Engine received")
+async def handle_chat_message(user_message: str, collection_name: str) -> AsyncGenerator[str, None]:
+    timestamp, start_time = time.time(), time.perf_counter()
+    route, response_str, first_token_seconds = "error", "", None
 
-    streaming_chat_response: StreamingAgentChatResponse = await chat_engine.astream_chat(
-        user_message
-    )
+    # the request is served by one index version, even if a new one is swapped in meanwhile
+    async with index_manager.lease(collection_name) as (index_version, index):
+        retriever = SpeculativeRetriever(
+            index.as_retriever(similarity_top_k=settings.TOP_K),
+            user_message,
+            similarity_threshold=settings.SPECULATIVE_RETRIEVAL_SIMILARITY,
+        )
+        # embed and search for the message right away; the lookup of a precomputed answer and
+        # the agent's tool call both reuse the nodes
+        retriever.prefetch()
 
-    response_str = ""
-    async for text in streaming_chat_response.async_response_gen():
-        response_str += text
-        yield text
+        try:
+            # when there are precomputed answers, the agent is only called if none matches,
+            # so that a precomputed answer never pays for a planning call
+            precomputed_answer = await _get_precomputed_answer(retriever)
+            if precomputed_answer is not None:
+                route, response_str = "precomputed", precomputed_answer
+                first_token_seconds = time.perf_counter() - start_time
+                yield precomputed_answer
+                return
 
-    if response_str.strip() == "":
-        yield "Sorry, I either wasn't able to understand your question or I don't have an answer for it."
+            chat_engine = get_chat_engine(retriever)
+            logger.debug("Engine received")
+            streaming_chat_response: StreamingAgentChatResponse = await chat_engine.astream_chat(
+                user_message
+            )
+
+            async for text in streaming_chat_response.async_response_gen():
+                if first_token_seconds is None:
+                    first_token_seconds = time.perf_counter() - start_time
+                response_str += text
+                yield text
+
+            route = "agent_direct" if retriever.speculative_hit is None else "agent_tool"
+            if response_str.strip() == "":
+                route = "empty"
+                yield "Sorry, I either wasn't able to understand your question or I don't have an answer for it."
+        except (GeneratorExit, asyncio.CancelledError):
+            # the client went away
+            route = "cancelled"
+            raise
+        finally:
+            retriever.close()
+
+            log_query(
+                timestamp,
+                user_message,
+                route,
+                retriever.retrieved_nodes,
+                timings={
+                    "retrieval": retriever.retrieval_seconds,
+                    "first_token": first_token_seconds,
+                    "total": time.perf_counter() - start_time,
+                },
+                response=response_str,
+                collection=collection_name,
+                index_version=index_version,
+                speculative_hit=retriever.speculative_hit,
+            )
+
+
+async def _get_precomputed_answer(retriever: SpeculativeRetriever) -> str | None:
+    answers = load_precomputed_answers(settings.PRECOMPUTED_ANSWERS_PATH)
+    # skip waiting for the retrieval when there is nothing to match against
+    if not answers:
+        return None
+
+    try:
+        nodes = await retriever.get_prefetched_nodes()
+    except Exception:
+        logger.exception("Failed to retrieve nodes for the precomputed answers")
+        return None
+
+    return find_precomputed_answer(nodes, answers)
@@ -0,0 +1,82 @@
+import json
+import logging
+import math
+import os
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Mapping
+
+from llama_index.core.schema import NodeWithScore
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def load_precomputed_answers(answers_path: str) -> Mapping[str, dict[str, str]]:
+    """
+    Load the answers pre-generated by the ETL, keyed by the content hash of their FAQ entry.
+    The file is only read again when it changes, and the cached answers are returned read-only.
+
+    Args:
+        answers_path (str): The path to the precomputed answers.
+
+    Returns:
+        Mapping[str, dict[str, str]]: The stored answers, or an empty mapping if there are none.
+    """
+    try:
+        mtime = os.stat(answers_path).st_mtime
+    except FileNotFoundError:
+        return MappingProxyType({})
+
+    return MappingProxyType(_load_answers_file(answers_path, mtime))
+
+
+@lru_cache(maxsize=1)
+def _load_answers_file(answers_path: str, mtime: float) -> dict[str, dict[str, str]]:
+    # mtime is part of the cache key, so a rewritten file is loaded again
+    with open(answers_path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def get_cosine_similarity(score: float) -> float:
+    """
+    Convert the similarity score of a retrieved node to the cosine similarity of the embeddings.
+
+    The vector stores score a node as exp(-d), where d is the squared L2 distance. Embeddings
+    are unit-norm, so d = 2 - 2 * cosine.
+    """
+    if score <= 0:
+        return -1.0
+    return 1 + math.log(score) / 2
+
+
+def find_precomputed_answer(
+    nodes: list[NodeWithScore], answers: Mapping[str, dict[str, str]]
+) -> str | None:
+    """
+    Find the stored answer of the FAQ entry that matches the retrieved nodes with high confidence.
+
+    Args:
+        nodes (list[NodeWithScore]): The retrieved nodes, the most similar first.
+        answers (Mapping[str, dict[str, str]]): The stored answers, see load_precomputed_answers.
+
+    Returns:
+        str | None: The stored answer, or None if there is no confident match.
+    """
+    if not nodes:
+        return None
+
+    top_node = nodes[0]
+    if top_node.score is None:
+        return None
+    if get_cosine_similarity(top_node.score) < settings.PRECOMPUTED_SIMILARITY_THRESHOLD:
+        return None
+
+    content_hash = top_node.node.metadata.get("content_hash")
+    answer = answers.get(content_hash)
+    if answer is None:
+        return None
+
+    logger.debug(f"Serving the precomputed answer for {answer['question']}")
+    return answer["answer"]
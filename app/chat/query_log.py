@@ -0,0 +1,190 @@
+"""
+Structured log of conversation requests, one JSON object per line.
+
+Requests only put a record on a queue. Serializing, counting tokens and writing happen in the
+thread of a `QueueListener`, and rotated files are gzipped. The log feeds the replay load
+generator (`app/data/replay.py`) and the ranking of hot questions in the ETL.
+"""
+
+import glob
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Iterator
+
+from llama_index.core.schema import MetadataMode, NodeWithScore
+from llama_index.core.utils import get_tokenizer
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_query_logger = logging.getLogger("app.query_log")
+_query_logger.propagate = False
+
+_listener: QueueListener | None = None
+
+
+class _DeferredQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # keep the payload as is, so that it is formatted in the listener thread
+        return record
+
+
+class _QueryLogFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        # RotatingFileHandler formats every record twice, once to decide on the rollover
+        if hasattr(record, "formatted_query"):
+            return record.formatted_query
+
+        payload = dict(record.msg)
+        tokenizer = get_tokenizer()
+
+        context_texts = payload.pop("context_texts")
+        response = payload.pop("response")
+        payload["tokens"] = {
+            "context": sum(len(tokenizer(text)) for text in context_texts),
+            "response": len(tokenizer(response)),
+        }
+
+        record.formatted_query = json.dumps(payload, ensure_ascii=False)
+        return record.formatted_query
+
+
+def start_query_log() -> None:
+    """
+    Start writing the query log of this worker, if it is enabled.
+    """
+    global _listener
+    if settings.QUERY_LOG_PATH is None or _listener is not None:
+        return
+
+    log_dir = os.path.dirname(settings.QUERY_LOG_PATH)
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+    file_handler = RotatingFileHandler(
+        f"{settings.QUERY_LOG_PATH}.{os.getpid()}",
+        maxBytes=settings.QUERY_LOG_MAX_BYTES,
+        backupCount=settings.QUERY_LOG_BACKUP_COUNT,
+        encoding="utf-8",
+    )
+    file_handler.namer = _gzip_namer
+    file_handler.rotator = _gzip_rotator
+    file_handler.setFormatter(_QueryLogFormatter())
+
+    log_queue = queue.SimpleQueue()
+    _query_logger.addHandler(_DeferredQueueHandler(log_queue))
+    _query_logger.setLevel(logging.INFO)
+
+    _listener = QueueListener(log_queue, file_handler)
+    _listener.start()
+    logger.info(f"Writing the query log to {file_handler.baseFilename}")
+
+
+def stop_query_log() -> None:
+    """
+    Flush the queued records and stop writing the query log.
+    """
+    global _listener
+    if _listener is None:
+        return
+
+    _listener.stop()
+    for handler in list(_query_logger.handlers):
+        _query_logger.removeHandler(handler)
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+
+
+def log_query(
+    timestamp: float,
+    question: str,
+    route: str,
+    nodes: list[NodeWithScore],
+    timings: dict[str, float | None],
+    response: str,
+    **extra,
+) -> None:
+    """
+    Log a conversation request. This only puts the record on a queue.
+
+    Args:
+        timestamp (float): When the request arrived, in seconds since the epoch.
+        question (str): The user's message.
+        route (str): How the request was answered, e.g. "precomputed" or "agent_tool".
+        nodes (list[NodeWithScore]): The retrieved nodes, the most similar first.
+        timings (dict[str, float | None]): The durations of the stages in seconds.
+        response (str): The streamed response, used to count its tokens.
+        **extra: Additional fields of the record.
+    """
+    if _listener is None:
+        return
+
+    _query_logger.info(
+        {
+            "timestamp": timestamp,
+            "question": question,
+            "route": route,
+            "node_ids": [node.node.node_id for node in nodes],
+            "content_hashes": [node.node.metadata.get("content_hash") for node in nodes],
+            "scores": [node.score for node in nodes],
+            "timings_ms": {
+                stage: round(seconds * 1000, 1) if seconds is not None else None
+                for stage, seconds in timings.items()
+            },
+            **extra,
+            # replaced by token counts in the listener thread
+            "context_texts": [
+                node.node.get_content(metadata_mode=MetadataMode.LLM) for node in nodes
+            ],
+            "response": response,
+        }
+    )
+
+
+def iter_query_log(query_log_path: str) -> Iterator[dict]:
+    """
+    Stream the records of every query log file, line by line and in no particular order.
+
+    Args:
+        query_log_path (str): The base path of the query log.
+
+    Yields:
+        dict: The logged records.
+    """
+    for path in sorted(glob.glob(f"{query_log_path}*")):
+        open_func = gzip.open if path.endswith(".gz") else open
+        with open_func(path, "rt", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skip a malformed line in {path}")
+
+
+def load_query_log(query_log_path: str) -> list[dict]:
+    """
+    Load the records of every query log file into memory, ordered by arrival.
+
+    Args:
+        query_log_path (str): The base path of the query log.
+
+    Returns:
+        list[dict]: The logged records.
+    """
+    return sorted(iter_query_log(query_log_path), key=lambda record: record["timestamp"])
+
+
+def _gzip_namer(name: str) -> str:
+    return f"{name}.gz"
+
+
+def _gzip_rotator(source: str, dest: str) -> None:
+    with open(source, "rb") as source_file, gzip.open(dest, "wb") as dest_file:
+        shutil.copyfileobj(source_file, dest_file)
+    os.remove(source)
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from difflib import SequenceMatcher
+
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+
+logger = logging.getLogger(__name__)
+
+# per worker, since the worker started
+_stats: Counter[str] = Counter()
+
+
+class SpeculativeRetriever(BaseRetriever):
+    """
+    Retrieves for the user's message as soon as it arrives, concurrently with the agent's planning
+    call. When the agent then queries with nearly the same text, the prefetched nodes are reused
+    instead of embedding and searching again.
+    """
+
+    def __init__(self, retriever: BaseRetriever, user_message: str, similarity_threshold: float):
+        super().__init__()
+        self._retriever = retriever
+        self._user_message = user_message
+        self._similarity_threshold = similarity_threshold
+        self._prefetch_task: asyncio.Task | None = None
+        self._prefetch_seconds: float | None = None
+
+        # what the last retrieval served, for the query log
+        self.retrieved_nodes: list[NodeWithScore] = []
+        self.retrieval_seconds: float | None = None
+        # None while the agent has not retrieved
+        self.speculative_hit: bool | None = None
+
+    def prefetch(self) -> None:
+        self._prefetch_task = asyncio.create_task(self._prefetch())
+
+    async def get_prefetched_nodes(self) -> list[NodeWithScore]:
+        if self._prefetch_task is None:
+            self.prefetch()
+
+        nodes = await self._prefetch_task
+        self.retrieved_nodes, self.retrieval_seconds = nodes, self._prefetch_seconds
+        return nodes
+
+    def close(self) -> None:
+        """
+        Cancel the prefetch if it is still running, and consume its error if it failed.
+        """
+        if self._prefetch_task is None:
+            return
+        if not self._prefetch_task.done():
+            self._prefetch_task.cancel()
+        elif not self._prefetch_task.cancelled():
+            self._prefetch_task.exception()
+
+    async def _prefetch(self) -> list[NodeWithScore]:
+        start_time = time.perf_counter()
+        nodes = await self._retriever.aretrieve(self._user_message)
+        self._prefetch_seconds = time.perf_counter() - start_time
+        return nodes
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        return self._retriever.retrieve(query_bundle)
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        if self._prefetch_task is not None and self._is_similar(query_bundle.query_str):
+            try:
+                nodes = await self.get_prefetched_nodes()
+            except Exception:
+                logger.exception("Failed to prefetch the nodes")
+            else:
+                _stats["hits"] += 1
+                self.speculative_hit = True
+                logger.debug(f"Reused the prefetched nodes for {query_bundle.query_str}")
+                return nodes
+
+        _stats["misses"] += 1
+        self.speculative_hit = False
+        logger.debug(f"Retrieve again for {query_bundle.query_str}")
+
+        start_time = time.perf_counter()
+        nodes = await self._retriever.aretrieve(query_bundle)
+        self.retrieved_nodes, self.retrieval_seconds = nodes, time.perf_counter() - start_time
+        return nodes
+
+    def _is_similar(self, query_str: str) -> bool:
+        similarity = SequenceMatcher(
+            None, " ".join(query_str.split()), " ".join(self._user_message.split())
+        ).ratio()
+        return similarity >= self._similarity_threshold
+
+
+def get_hit_rate() -> float | None:
+    """
+    Returns the share of the agent's retrievals served by the prefetch, or None before any.
+    """
+    total = _stats["hits"] + _stats["misses"]
+    if total == 0:
+        return None
+    return _stats["hits"] / total
@@ -2,6 +2,7 @@ from enum import Enum
 import os
 from pathlib import Path
 
+from pydantic import model_validator
 from pydantic_settings import BaseSettings
 
 
@@ -13,6 +14,21 @@ class AppEnvironment(str, Enum):
     PRODUCTION = "production"
 
 
+class EmbeddingBackend(str, Enum):
+    """Enum for embedding backends."""
+
+    OPENAI = "openai"
+    LOCAL = "local"
+    HASHING = "hashing"
+
+
+class IndexFormat(str, Enum):
+    """Enum for the formats the index is served from."""
+
+    CHROMA = "chroma"
+    SNAPSHOT = "snapshot"
+
+
 class Settings(BaseSettings):
     """Application settings."""
 
@@ -33,12 +49,79 @@ class Settings(BaseSettings):
     CHUNK_SIZE: int = 512
     CHUNK_OVERLAP: int = 128
 
+    EMBEDDING_BACKEND: EmbeddingBackend = EmbeddingBackend.OPENAI
+    # A multilingual sentence-transformers model, since the FAQ is in Korean
+    LOCAL_EMBEDDING_MODEL: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+    # Concurrent query embeddings are collected for up to this long and embedded together
+    LOCAL_EMBEDDING_BATCH_WAIT_MS: float = 5.0
+    LOCAL_EMBEDDING_MAX_BATCH_SIZE: int = 32
+    # Query embeddings are cached across requests and collections. 0 disables the cache.
+    EMBEDDING_CACHE_SIZE: int = 4096
+
     BASE_PATH: Path = Path(__file__).parent.parent
     PKL_PATH: str = str(BASE_PATH / "data" / "raw" / "final_result.pkl")
     DB_PATH: str = str(BASE_PATH / "data" / "db")
+    # The collection served when a request does not select one
     COLLECTION_NAME: str = "qna"
+    # Every FAQ corpus is a collection, keyed by its name, with the path to its pkl file.
+    # Defaults to COLLECTION_NAME with PKL_PATH.
+    CORPORA: dict[str, str] = {}
+    # Idle snapshot collections are evicted from a worker beyond this estimated memory use.
+    # Chroma applies the same limit to its own cache of vector indexes.
+    COLLECTION_MEMORY_BUDGET_BYTES: int = 1024 * 1024 * 1024
+    # The snapshot is an int8-quantized export of the collection, see app/data/snapshot.py
+    INDEX_FORMAT: IndexFormat = IndexFormat.CHROMA
+    # The int8 search rescores TOP_K * SNAPSHOT_RESCORE_FACTOR candidates with the float vectors
+    SNAPSHOT_RESCORE_FACTOR: int = 4
+    # How often each worker checks for a new index version
+    INDEX_WATCH_INTERVAL_SECONDS: float = 5.0
 
     TOP_K: int = 5
+    # Minimum similarity between the agent's tool query and the user's message
+    # to reuse the nodes retrieved speculatively for the message
+    SPECULATIVE_RETRIEVAL_SIMILARITY: float = 0.8
+
+    # Pre-generated answers for the hottest FAQ entries.
+    # Entries are ranked by PRECOMPUTED_QUESTIONS if given, otherwise by the query log.
+    PRECOMPUTED_ANSWERS_PATH: str = str(BASE_PATH / "data" / "precomputed_answers.json")
+    PRECOMPUTED_TOP_N: int = 200
+    PRECOMPUTED_QUESTIONS: list[str] = []
+    # Defaults to QUERY_LOG_PATH
+    PRECOMPUTED_QUERY_LOG_PATH: str | None = None
+    # Minimum cosine similarity between the message and the top retrieved node to serve its
+    # stored answer. Calibrate it for the embedding model with `python -m app.data.tuning
+    # --calibrate-precomputed`. The default suits ada-002, whose cosines mostly lie in 0.7-1.0.
+    PRECOMPUTED_SIMILARITY_THRESHOLD: float = 0.9
+
+    # Structured log of conversation requests, written off the event loop. It holds the raw user
+    # questions, so it is opt-in, e.g. app/data/logs/query.log, which git ignores.
+    # Each worker writes {QUERY_LOG_PATH}.{pid} and gzips it on rotation. None disables it.
+    QUERY_LOG_PATH: str | None = None
+    QUERY_LOG_MAX_BYTES: int = 50 * 1024 * 1024
+    QUERY_LOG_BACKUP_COUNT: int = 20
+
+    # Sampling CPU profiler of the worker while a request is served. Concurrent requests are
+    # mixed in, see app/core/profiling.py. A request is profiled when it sends PROFILING_TOKEN
+    # in the X-Profile-Token header, or at random with PROFILING_SAMPLE_RATE.
+    PROFILING_DIR: str = str(BASE_PATH / "data" / "profiles")
+    PROFILING_TOKEN: str | None = None
+    PROFILING_SAMPLE_RATE: float = 0.0
+    PROFILING_INTERVAL_SECONDS: float = 0.005
+    PROFILING_MAX_DURATION_SECONDS: float = 60.0
+    # Fraction of wall time the sampler may spend on itself before it backs off
+    PROFILING_MAX_OVERHEAD: float = 0.02
+    PROFILING_MAX_DISK_BYTES: int = 100 * 1024 * 1024
+
+    @model_validator(mode="after")
+    def check_corpora(self) -> "Settings":
+        """
+        Defaults the corpora to the default collection, after the environment is applied.
+        """
+        if not self.CORPORA:
+            self.CORPORA = {self.COLLECTION_NAME: self.PKL_PATH}
+        if self.COLLECTION_NAME not in self.CORPORA:
+            raise ValueError(f"The default collection {self.COLLECTION_NAME} is not in CORPORA")
+        return self
 
     @property
     def ENVIRONMENT(self) -> AppEnvironment:
@@ -0,0 +1,277 @@
+"""
+Embedding backends shared by the ETL and the chat engine.
+
+Every collection records the model and the dimension of the embeddings it was built with,
+so an index built with another backend is rejected when it is loaded.
+"""
+
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.embeddings.openai import (
+    OpenAIEmbedding,
+    OpenAIEmbeddingMode,
+    OpenAIEmbeddingModelType,
+)
+
+from app.core.config import EmbeddingBackend, settings
+
+logger = logging.getLogger(__name__)
+
+OPENAI_EMBEDDING_DIMENSIONS = {
+    OpenAIEmbeddingModelType.TEXT_EMBED_ADA_002.value: 1536,
+    OpenAIEmbeddingModelType.TEXT_EMBED_3_SMALL.value: 1536,
+    OpenAIEmbeddingModelType.TEXT_EMBED_3_LARGE.value: 3072,
+}
+
+# Collections built before the metadata was recorded all used ada-002
+LEGACY_EMBEDDING_METADATA = {
+    "embedding_model": OpenAIEmbeddingModelType.TEXT_EMBED_ADA_002.value,
+    "embedding_dimension": 1536,
+}
+
+
+class LocalEmbedding(BaseEmbedding):
+    """
+    sentence-transformers model running on the CPU.
+
+    Concurrent query embeddings are collected by a micro-batching queue for a few milliseconds
+    and embedded in a single forward pass.
+    """
+
+    batch_wait_ms: float = 5.0
+    max_batch_size: int = 32
+
+    _model = PrivateAttr(default=None)
+    _queue: asyncio.Queue | None = PrivateAttr(default=None)
+    _batcher: asyncio.Task | None = PrivateAttr(default=None)
+
+    @property
+    def dimension(self) -> int:
+        return self._get_model().get_sentence_embedding_dimension()
+
+    def _get_model(self):
+        if self._model is None:
+            try:
+                from sentence_transformers import SentenceTransformer
+            except ImportError as e:
+                raise ImportError(
+                    "The local embedding backend requires `sentence-transformers`. "
+                    "Install it with `poetry add sentence-transformers`."
+                ) from e
+
+            self._model = SentenceTransformer(self.model_name, device="cpu")
+            logger.info(f"Loaded the local embedding model {self.model_name}")
+
+        return self._model
+
+    def _encode(self, texts: list[str]) -> list[list[float]]:
+        embeddings = self._get_model().encode(
+            texts, batch_size=self.max_batch_size, normalize_embeddings=True
+        )
+        return embeddings.tolist()
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        return self._encode([query])[0]
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        return self._encode([text])[0]
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        return self._encode(texts)
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        loop = asyncio.get_running_loop()
+        if self._batcher is None or self._batcher.done() or self._batcher.get_loop() is not loop:
+            self._queue = asyncio.Queue()
+            self._batcher = loop.create_task(self._run_batcher())
+
+        future = loop.create_future()
+        self._queue.put_nowait((query, future))
+
+        return await future
+
+    async def _run_batcher(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self._queue.get()]
+
+            deadline = loop.time() + self.batch_wait_ms / 1000
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # run the model off the event loop
+            try:
+                embeddings = await asyncio.to_thread(self._encode, [query for query, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
+
+
+class HashingEmbedding(BaseEmbedding):
+    """
+    Deterministic embedding of hashed character n-grams. It is a stand-in for the real
+    embedding model, not a replacement: absolute scores differ, relative ones are comparable.
+    """
+
+    model_name: str = "hashing"
+    dimension: int = 512
+    ngram_size: int = 2
+
+    def _embed(self, text: str) -> list[float]:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for i in range(max(len(text) - self.ngram_size + 1, 1)):
+            digest = hashlib.blake2b(text[i : i + self.ngram_size].encode("utf-8"), digest_size=8)
+            value = int.from_bytes(digest.digest(), "little")
+            vector[value % self.dimension] += 1.0 if value >> 63 else -1.0
+
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm > 0 else vector).tolist()
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        return self._embed(query)
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        return self._embed(text)
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    LRU cache of query embeddings in front of another embedding model.
+    Text embeddings, which are only computed by the ETL, are not cached.
+    """
+
+    max_size: int = 4096
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _cache: OrderedDict = PrivateAttr()
+
+    def __init__(self, embed_model: BaseEmbedding, max_size: int = 4096):
+        super().__init__(
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            max_size=max_size,
+        )
+        self._embed_model = embed_model
+        self._cache = OrderedDict()
+
+    @property
+    def wrapped(self) -> BaseEmbedding:
+        return self._embed_model
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        if query not in self._cache:
+            self._put(query, self._embed_model._get_query_embedding(query))
+        return self._get(query)
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        if query not in self._cache:
+            self._put(query, await self._embed_model._aget_query_embedding(query))
+        return self._get(query)
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        return self._embed_model._get_text_embedding(text)
+
+    async def _aget_text_embedding(self, text: str) -> list[float]:
+        return await self._embed_model._aget_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        return self._embed_model._get_text_embeddings(texts)
+
+    def _get(self, query: str) -> list[float]:
+        self._cache.move_to_end(query)
+        return self._cache[query]
+
+    def _put(self, query: str, embedding: list[float]) -> None:
+        self._cache[query] = embedding
+        if len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+
+@lru_cache(maxsize=1)
+def get_embed_model() -> BaseEmbedding:
+    """
+    Returns the embedding model of the configured backend. It is shared within a process,
+    so that all collections use one HTTP client and one query embedding cache, and concurrent
+    requests are batched together by the local backend.
+    """
+    if settings.EMBEDDING_BACKEND == EmbeddingBackend.LOCAL:
+        embed_model = LocalEmbedding(
+            model_name=settings.LOCAL_EMBEDDING_MODEL,
+            batch_wait_ms=settings.LOCAL_EMBEDDING_BATCH_WAIT_MS,
+            max_batch_size=settings.LOCAL_EMBEDDING_MAX_BATCH_SIZE,
+        )
+    elif settings.EMBEDDING_BACKEND == EmbeddingBackend.HASHING:
+        embed_model = HashingEmbedding()
+    else:
+        embed_model = OpenAIEmbedding(
+            mode=OpenAIEmbeddingMode.SIMILARITY_MODE,
+            model_type=OpenAIEmbeddingModelType.TEXT_EMBED_ADA_002,
+            api_key=settings.OPENAI_API_KEY,
+        )
+
+    if settings.EMBEDDING_CACHE_SIZE > 0:
+        return CachedEmbedding(embed_model, max_size=settings.EMBEDDING_CACHE_SIZE)
+    return embed_model
+
+
+def get_embedding_metadata(embed_model: BaseEmbedding) -> dict[str, str | int]:
+    """
+    Returns the collection metadata that identifies the embeddings of the given model.
+    """
+    if isinstance(embed_model, CachedEmbedding):
+        embed_model = embed_model.wrapped
+
+    if isinstance(embed_model, OpenAIEmbedding):
+        dimension = OPENAI_EMBEDDING_DIMENSIONS[embed_model.model_name]
+    else:
+        dimension = embed_model.dimension
+
+    return {"embedding_model": embed_model.model_name, "embedding_dimension": dimension}
+
+
+def check_embedding_metadata(collection_metadata: dict | None, embed_model: BaseEmbedding) -> None:
+    """
+    Check that a collection was built with the given embedding model.
+
+    Args:
+        collection_metadata (dict | None): The metadata of the collection.
+        embed_model (BaseEmbedding): The embedding model used for querying.
+
+    Raises:
+        ValueError: If the collection was built with another model or dimension.
+    """
+    expected = get_embedding_metadata(embed_model)
+    actual = {
+        key: (collection_metadata or {}).get(key, value)
+        for key, value in LEGACY_EMBEDDING_METADATA.items()
+    }
+
+    if actual != expected:
+        raise ValueError(
+            f"The index was built with {actual['embedding_model']} "
+            f"({actual['embedding_dimension']} dimensions), but the configured embedding model is "
+            f"{expected['embedding_model']} ({expected['embedding_dimension']} dimensions)"
+        )
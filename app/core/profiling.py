@@ -0,0 +1,200 @@
+"""
+On-demand statistical profiling of single requests.
+
+While a request is served, a background thread samples the stacks of every thread of the worker:
+the event loop thread and the threads that `asyncio.to_thread` runs Chroma loads and local
+embeddings on. A thread is only sampled when it has used CPU since the previous sample, so idle
+waits such as the event loop's `select` are left out. Each stack is rooted at its thread's name,
+and the samples are written in the folded stack format, which is read by flamegraph.pl,
+speedscope and inferno. At most one request per worker is profiled at a time.
+
+The profile is of the worker while the request runs, not of the request alone: the work of
+concurrent requests on the same threads is mixed in. Profile at low traffic, or compare with the
+request's query log timings. Platforms without per-thread CPU clocks sample on wall-clock time.
+"""
+
+import logging
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+MAX_STACK_DEPTH = 256
+
+# only one profile per worker at a time, which bounds the overhead
+_profiling_lock = threading.Lock()
+
+
+class RequestProfiler:
+    def __init__(
+        self,
+        output_dir: str,
+        interval: float,
+        max_duration: float,
+        max_overhead: float,
+        max_disk_bytes: int,
+    ):
+        self._output_dir = output_dir
+        self._interval = interval
+        self._max_duration = max_duration
+        self._max_overhead = max_overhead
+        self._max_disk_bytes = max_disk_bytes
+
+        self._samples: Counter[str] = Counter()
+        # the CPU time of each thread at its previous sample
+        self._cpu_times: dict[int, float] = {}
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop sampling. The profile is written by the sampler thread, so this never blocks.
+        """
+        self._stop_event.set()
+
+    def _run(self) -> None:
+        try:
+            started_at = time.monotonic()
+            sampling_time = 0.0
+            # record the CPU time of every thread, so that the first sample counts as well
+            for thread_id in sys._current_frames():
+                self._used_cpu(thread_id)
+
+            while not self._stop_event.wait(self._interval):
+                elapsed = time.monotonic() - started_at
+                if elapsed > self._max_duration:
+                    logger.debug("Stop profiling after reaching the maximum duration")
+                    break
+
+                sample_started_at = time.perf_counter()
+                self._sample()
+                sampling_time += time.perf_counter() - sample_started_at
+
+                # back off when the sampler costs more than allowed
+                if sampling_time > self._max_overhead * elapsed:
+                    self._interval *= 2
+
+            self._write_profile()
+        except Exception:
+            logger.exception("Failed to profile the request")
+        finally:
+            _profiling_lock.release()
+
+    def _sample(self) -> None:
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own_thread_id = threading.get_ident()
+
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread_id or not self._used_cpu(thread_id):
+                continue
+
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.append(thread_names.get(thread_id, str(thread_id)))
+
+            self._samples[";".join(reversed(stack))] += 1
+
+    def _used_cpu(self, thread_id: int) -> bool:
+        if not hasattr(time, "pthread_getcpuclockid"):
+            return True
+
+        try:
+            cpu_time = time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+        except OSError:
+            # the thread has exited
+            return False
+
+        previous_cpu_time = self._cpu_times.get(thread_id)
+        self._cpu_times[thread_id] = cpu_time
+        return previous_cpu_time is not None and cpu_time > previous_cpu_time
+
+    def _write_profile(self) -> None:
+        if not self._samples:
+            return
+
+        os.makedirs(self._output_dir, exist_ok=True)
+        file_name = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.folded"
+        path = os.path.join(self._output_dir, file_name)
+
+        with open(path, "w", encoding="utf-8") as file:
+            for stack, count in self._samples.items():
+                file.write(f"{stack} {count}\n")
+
+        logger.info(f"Saved the profile of {sum(self._samples.values())} samples to {path}")
+        _enforce_disk_limit(self._output_dir, self._max_disk_bytes)
+
+
+def start_request_profiler(profile_token: str | None) -> RequestProfiler | None:
+    """
+    Start profiling the current request if it is asked for or sampled.
+
+    Args:
+        profile_token (str | None): The token sent by the client in the X-Profile-Token header.
+
+    Returns:
+        RequestProfiler | None: The running profiler, or None if the request is not profiled.
+    """
+    requested = (
+        profile_token is not None
+        and settings.PROFILING_TOKEN is not None
+        # compared as bytes, since compare_digest rejects non-ASCII strings
+        and secrets.compare_digest(profile_token.encode(), settings.PROFILING_TOKEN.encode())
+    )
+    sampled = random.random() < settings.PROFILING_SAMPLE_RATE
+    if not (requested or sampled):
+        return None
+
+    if not _profiling_lock.acquire(blocking=False):
+        logger.debug("Skip profiling since another request is being profiled")
+        return None
+
+    try:
+        profiler = RequestProfiler(
+            output_dir=settings.PROFILING_DIR,
+            interval=settings.PROFILING_INTERVAL_SECONDS,
+            max_duration=settings.PROFILING_MAX_DURATION_SECONDS,
+            max_overhead=settings.PROFILING_MAX_OVERHEAD,
+            max_disk_bytes=settings.PROFILING_MAX_DISK_BYTES,
+        )
+        profiler.start()
+    except Exception:
+        # the sampler thread releases the lock, so release it here if it never started;
+        # the request is still served, just not profiled
+        _profiling_lock.release()
+        logger.exception("Failed to start profiling the request")
+        return None
+
+    return profiler
+
+
+def _enforce_disk_limit(output_dir: str, max_disk_bytes: int) -> None:
+    """
+    Remove the oldest profiles until the directory fits in the disk budget.
+    """
+    paths = [
+        os.path.join(output_dir, file_name)
+        for file_name in os.listdir(output_dir)
+        if file_name.endswith(".folded")
+    ]
+    paths.sort(key=os.path.getmtime)
+
+    total_bytes = sum(os.path.getsize(path) for path in paths)
+    while paths and total_bytes > max_disk_bytes:
+        path = paths.pop(0)
+        total_bytes -= os.path.getsize(path)
+        os.remove(path)
+        logger.debug(f"Removed the old profile {path}")
@@ -2,26 +2,39 @@
 We suppose that we have a pkl file `{root_directory}/final_result.pkl` that contains raw data of FAQ @ NAVER Smart Store Platform.
 """
 
+import hashlib
+import json
 import os
 import pickle
 import time
 import logging
+from collections import Counter
 
 import numpy as np
 import chromadb
 
 from llama_index.core import Document, VectorStoreIndex, ServiceContext, StorageContext
 from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import NodeWithScore
 from llama_index.vector_stores.chroma import ChromaVectorStore
 from llama_index.llms.openai import OpenAI
-from llama_index.embeddings.openai import (
-    OpenAIEmbedding,
-    OpenAIEmbeddingMode,
-    OpenAIEmbeddingModelType,
-)
 
 
 from app.core.config import settings
+from app.core.embedding import get_embed_model, get_embedding_metadata
+from app.data.snapshot import export_snapshot, get_snapshot_path
+from app.data.versions import (
+    LEGACY_VERSION,
+    build_lock,
+    get_current_version,
+    get_version_path,
+    new_version,
+    remove_unused_versions,
+    set_current_version,
+)
+from app.chat.precomputed import load_precomputed_answers
+from app.chat.query_log import iter_query_log
+from app.chat.qa_response_synth import get_custom_response_synth
 
 logger = logging.getLogger(__name__)
 
@@ -41,16 +54,72 @@ def time_logger(func):
     return wrapper
 
 
-def extract_transform_load(pkl_path: str, db_path: str, collection_name: str) -> None:
-    if os.path.exists(db_path) and os.listdir(db_path):
-        logging.debug(f"Already existing database from {db_path}")
-        logging.debug("Skip saving the database")
-        return
+def extract_transform_load(corpora: dict[str, str], db_path: str, rebuild: bool = False) -> None:
+    """
+    Build the collection of every corpus into a new version directory under `db_path`
+    and make it current. Running workers pick up the new version without restarting.
+    The answers of the hottest FAQ entries are pre-generated along with a new version.
+
+    Args:
+        corpora (dict[str, str]): The path to the raw FAQ data, keyed by collection name.
+        db_path (str): The directory holding the index versions.
+        rebuild (bool): Whether to build a new version even if one already has every collection.
+    """
+    # one build at a time; a build waiting for another one sees its version when it proceeds
+    with build_lock(db_path):
+        current_version = get_current_version(db_path)
+        if not rebuild and _has_collections(db_path, current_version, list(corpora)):
+            logging.debug(f"Already existing database version {current_version} from {db_path}")
+            logging.debug("Skip saving the database")
+            return
+
+        documents_by_collection = {
+            collection_name: _preprocess_raw_data(_load_raw_data(pkl_path))
+            for collection_name, pkl_path in corpora.items()
+        }
+
+        version = new_version(db_path)
+        version_path = get_version_path(db_path, version)
+        for collection_name, documents in documents_by_collection.items():
+            _save_db(version_path, collection_name, documents)
+            export_snapshot(version_path, collection_name)
+        set_current_version(db_path, version)
+        remove_unused_versions(db_path, locked=True)
+
+    if settings.PRECOMPUTED_TOP_N > 0:
+        # answers are keyed by content hash, so one store serves every collection
+        all_documents = [
+            document for documents in documents_by_collection.values() for document in documents
+        ]
+        _save_precomputed_answers(settings.PRECOMPUTED_ANSWERS_PATH, all_documents)
+
+
+def refresh() -> None:
+    """Launched with `poetry run refresh` to rebuild the index while the service is running."""
+    logging.basicConfig(level=settings.LOG_LEVEL.upper())
+    extract_transform_load(settings.CORPORA, settings.DB_PATH, rebuild=True)
+
+
+def _has_collections(db_path: str, version: str | None, collection_names: list[str]) -> bool:
+    if version is None:
+        return False
+    if version == LEGACY_VERSION:
+        # a database from before versioning only has the default collection
+        return collection_names == [settings.COLLECTION_NAME]
+
+    version_path = get_version_path(db_path, version)
+    return all(
+        os.path.exists(get_snapshot_path(version_path, collection_name))
+        for collection_name in collection_names
+    )
 
-    raw_data = _load_raw_data(pkl_path)
-    documents = _preprocess_raw_data(raw_data)
 
-    _save_db(db_path, collection_name, documents)
+def get_content_hash(question: str, answer: str, categories: str) -> str:
+    """
+    Hash the content of a FAQ entry so that derived data can be invalidated when it changes.
+    """
+    content = "\n".join([categories, question, answer])
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
 
 
 def _get_outlier_bound(nums):
@@ -97,8 +166,14 @@ def _preprocess_raw_data(raw_data: dict[str, str]) -> list[Document]:
 
         document = Document(
             text=f"질문: {question}\n대답: {answer}",
-            metadata={"categories": categories},
-            excluded_llm_metadata_keys=[],
+            metadata={
+                "categories": categories,
+                "question": question,
+                "content_hash": get_content_hash(question, answer, categories),
+            },
+            # bookkeeping keys must not leak into embeddings or prompts
+            excluded_embed_metadata_keys=["question", "content_hash"],
+            excluded_llm_metadata_keys=["question", "content_hash"],
             metadata_seperator=settings.METADATA_SEPERATOR,
             metadata_template=settings.METADATA_TEMPLATE,
             text_template=settings.TEXT_TEMPLATE,
@@ -152,11 +227,7 @@ def _get_tool_service_context() -> ServiceContext:
         api_key=settings.OPENAI_API_KEY,
     )
 
-    embedding_model = OpenAIEmbedding(
-        mode=OpenAIEmbeddingMode.SIMILARITY_MODE,
-        model_type=OpenAIEmbeddingModelType.TEXT_EMBED_ADA_002,
-        api_key=settings.OPENAI_API_KEY,
-    )
+    embedding_model = get_embed_model()
 
     # Use a smaller chunk size to retrieve more granular results
     node_parser = SentenceSplitter.from_defaults(
@@ -178,7 +249,9 @@ def _save_db(db_path: str, collection_name: str, documents: list[Document]) -> N
         os.makedirs(db_path)
 
     client = chromadb.PersistentClient(path=db_path)
-    chroma_collection = client.create_collection(collection_name)
+    chroma_collection = client.create_collection(
+        collection_name, metadata=get_embedding_metadata(get_embed_model())
+    )
     vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
     storage_context = StorageContext.from_defaults(vector_store=vector_store)
 
@@ -188,3 +261,93 @@ def _save_db(db_path: str, collection_name: str, documents: list[Document]) -> N
         service_context=_get_tool_service_context(),
         show_progress=True,
     )
+
+
+def _rank_hot_documents(
+    documents: list[Document],
+    top_n: int,
+    questions: list[str],
+    query_log_path: str | None,
+) -> list[Document]:
+    """
+    Rank the FAQ entries that are asked the most.
+
+    Args:
+        documents (list[Document]): The preprocessed FAQ documents.
+        top_n (int): The maximum number of documents to return.
+        questions (list[str]): Explicitly supplied FAQ questions, in order of priority.
+        query_log_path (str | None): The base path of the query log. Rotated, gzipped files
+            next to it are read as well.
+
+    Returns:
+        list[Document]: At most `top_n` documents, the hottest first.
+    """
+    if questions:
+        documents_by_question = {document.metadata["question"]: document for document in documents}
+        hot_documents = [documents_by_question[q] for q in questions if q in documents_by_question]
+        return hot_documents[:top_n]
+
+    if not query_log_path:
+        logging.debug("Neither hot questions nor a query log are given")
+        return []
+
+    # count how often each entry was the top retrieved one, streaming the log since it can
+    # be far larger than memory
+    counter = Counter(
+        record["content_hashes"][0]
+        for record in iter_query_log(query_log_path)
+        if record.get("content_hashes")
+    )
+
+    documents_by_hash = {document.metadata["content_hash"]: document for document in documents}
+    return [
+        documents_by_hash[content_hash]
+        for content_hash, _ in counter.most_common()
+        if content_hash in documents_by_hash
+    ][:top_n]
+
+
+@time_logger
+def _save_precomputed_answers(answers_path: str, documents: list[Document]) -> None:
+    """
+    Generate canonical answers for the hottest FAQ entries offline.
+
+    Answers are keyed by the content hash of their entry. Answers of entries whose content
+    is unchanged are reused, and answers of changed or cooled-down entries are dropped.
+    """
+    hot_documents = _rank_hot_documents(
+        documents,
+        settings.PRECOMPUTED_TOP_N,
+        settings.PRECOMPUTED_QUESTIONS,
+        settings.PRECOMPUTED_QUERY_LOG_PATH or settings.QUERY_LOG_PATH,
+    )
+    stored_answers = load_precomputed_answers(answers_path)
+    response_synthesizer = get_custom_response_synth(service_context=_get_tool_service_context())
+
+    answers = {}
+    for document in hot_documents:
+        content_hash = document.metadata["content_hash"]
+        if content_hash in stored_answers:
+            answers[content_hash] = stored_answers[content_hash]
+            continue
+
+        response = response_synthesizer.synthesize(
+            document.metadata["question"],
+            nodes=[NodeWithScore(node=document, score=1.0)],
+        )
+        answers[content_hash] = {
+            "question": document.metadata["question"],
+            "answer": str(response),
+        }
+
+    logging.debug(f"The number of precomputed answers: {len(answers)}")
+    num_new_answers = len(set(answers) - set(stored_answers))
+    logging.debug(f"The number of newly generated answers: {num_new_answers}")
+
+    answers_dir = os.path.dirname(answers_path)
+    if answers_dir:
+        os.makedirs(answers_dir, exist_ok=True)
+    tmp_path = f"{answers_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(answers, file, ensure_ascii=False)
+    os.replace(tmp_path, answers_path)
@@ -0,0 +1,136 @@
+"""
+Replay the query log against a running service as a load test.
+
+Requests are sent at the arrival times recorded in the log, compressed or stretched by
+`--speed`, or at a fixed `--rate`. Rotated, gzipped files of every worker are read.
+
+Usage:
+    python -m app.data.replay --base-url http://localhost:8000 --speed 2
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+
+import httpx
+import numpy as np
+
+from app.core.config import settings
+from app.chat.query_log import load_query_log
+
+logger = logging.getLogger(__name__)
+
+
+def get_send_offsets(records: list[dict], speed: float, rate: float | None) -> list[float]:
+    """
+    Returns when to send each request, in seconds from the start of the replay.
+    """
+    if rate is not None:
+        return [i / rate for i in range(len(records))]
+
+    first_timestamp = records[0]["timestamp"]
+    return [(record["timestamp"] - first_timestamp) / speed for record in records]
+
+
+async def _send(
+    client: httpx.AsyncClient,
+    semaphore: asyncio.Semaphore,
+    record: dict,
+    send_at: float,
+) -> dict:
+    await asyncio.sleep(max(send_at - time.perf_counter(), 0))
+
+    async with semaphore:
+        start_time = time.perf_counter()
+        first_byte_seconds = None
+        collection_name = record.get("collection", settings.COLLECTION_NAME)
+        try:
+            async with client.stream(
+                "GET",
+                f"{settings.API_PREFIX}/conversation/{collection_name}/message",
+                params={"user_message": record["question"]},
+            ) as response:
+                response.raise_for_status()
+                async for _ in response.aiter_bytes():
+                    if first_byte_seconds is None:
+                        first_byte_seconds = time.perf_counter() - start_time
+        except httpx.HTTPError as e:
+            logger.warning(f"Failed to send {record['question']}: {e}")
+            return {"ok": False}
+
+        return {
+            "ok": True,
+            # how late the request was sent, which grows when the client cannot keep up
+            "lag": start_time - send_at,
+            "first_byte": first_byte_seconds,
+            "total": time.perf_counter() - start_time,
+        }
+
+
+async def replay(
+    records: list[dict],
+    base_url: str,
+    speed: float,
+    rate: float | None,
+    max_concurrency: int,
+) -> list[dict]:
+    offsets = get_send_offsets(records, speed, rate)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    limits = httpx.Limits(max_connections=max_concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+        start_time = time.perf_counter()
+        return await asyncio.gather(
+            *[
+                _send(client, semaphore, record, start_time + offset)
+                for record, offset in zip(records, offsets)
+            ]
+        )
+
+
+def _print_results(results: list[dict], elapsed: float) -> None:
+    succeeded = [result for result in results if result["ok"]]
+    print(f"requests: {len(results)}, failed: {len(results) - len(succeeded)}")
+    print(f"achieved rate: {len(results) / elapsed:.2f} req/s over {elapsed:.1f} s")
+    if not succeeded:
+        return
+
+    for metric in ["first_byte", "total", "lag"]:
+        values = [result[metric] * 1000 for result in succeeded if result[metric] is not None]
+        if values:
+            print(
+                f"{metric:>10} ms  p50 {np.percentile(values, 50):>9.1f}  "
+                f"p95 {np.percentile(values, 95):>9.1f}  max {max(values):>9.1f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument(
+        "--query-log-path",
+        default=settings.QUERY_LOG_PATH,
+        required=settings.QUERY_LOG_PATH is None,
+    )
+    parser.add_argument("--speed", type=float, default=1.0, help="2 replays twice as fast")
+    parser.add_argument("--rate", type=float, help="Fixed requests per second instead")
+    parser.add_argument("--limit", type=int, help="Replay only the first requests")
+    parser.add_argument("--max-concurrency", type=int, default=100)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    records = load_query_log(args.query_log_path)[: args.limit]
+    if not records:
+        raise ValueError(f"No query log found at {args.query_log_path}")
+
+    start_time = time.perf_counter()
+    results = asyncio.run(
+        replay(records, args.base_url, args.speed, args.rate, args.max_concurrency)
+    )
+    _print_results(results, time.perf_counter() - start_time)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Compact snapshot of a collection, loaded with a single mmap.
+
+Layout of the file (little-endian):
+
+    b"FAQSNAP1" | uint64 header length | JSON header | sections, each aligned to 64 bytes
+
+Sections:
+    codes          int8    (count, dimension)   vectors quantized with a scale per vector
+    scales         float32 (count,)
+    squared_norms  float32 (count,)
+    vectors        float32 (count, dimension)   only read for the rescored shortlist
+    {ids,texts,metadatas}_offsets  uint64 (count + 1)
+    {ids,texts,metadatas}          utf-8 blobs, metadata as JSON per row
+
+Candidates are ranked by the int8 vectors and the shortlist is rescored with the exact float
+vectors, so only the int8 codes have to stay resident.
+"""
+
+import asyncio
+import json
+import logging
+import mmap
+import os
+import struct
+
+import chromadb
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import metadata_dict_to_node
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"FAQSNAP1"
+ALIGNMENT = 64
+# rows dequantized at once, which bounds the temporary memory of a search
+BLOCK_SIZE = 1024
+
+
+def get_snapshot_path(db_path: str, collection_name: str) -> str:
+    return os.path.join(db_path, f"{collection_name}.snapshot")
+
+
+def export_snapshot(db_path: str, collection_name: str) -> str:
+    """
+    Export a Chroma collection to a snapshot next to it.
+
+    Args:
+        db_path (str): The path to the Chroma database.
+        collection_name (str): The name of the collection.
+
+    Returns:
+        str: The path to the snapshot.
+    """
+    client = chromadb.PersistentClient(path=db_path)
+    collection = client.get_collection(collection_name)
+    records = collection.get(include=["embeddings", "documents", "metadatas"])
+
+    vectors = np.asarray(records["embeddings"], dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+
+    sections = {
+        "codes": codes,
+        "scales": scales.astype(np.float32),
+        "squared_norms": np.einsum("ij,ij->i", vectors, vectors).astype(np.float32),
+        "vectors": vectors,
+    }
+    for name, values in [
+        ("ids", records["ids"]),
+        ("texts", records["documents"]),
+        ("metadatas", [json.dumps(m, ensure_ascii=False) for m in records["metadatas"]]),
+    ]:
+        offsets, blob = _pack_strings(values)
+        sections[f"{name}_offsets"] = offsets
+        sections[name] = blob
+
+    path = get_snapshot_path(db_path, collection_name)
+    _write_sections(path, sections, {"collection_metadata": collection.metadata or {}})
+    logger.info(f"Exported {len(records['ids'])} vectors of {collection_name} to {path}")
+
+    return path
+
+
+class Snapshot:
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a snapshot")
+
+        (header_length,) = struct.unpack_from("<Q", self._mmap, len(MAGIC))
+        header_start = len(MAGIC) + 8
+        header = json.loads(self._mmap[header_start : header_start + header_length])
+
+        self.collection_metadata: dict = header["collection_metadata"]
+        self._sections = {
+            name: np.frombuffer(
+                self._mmap, dtype=np.dtype(dtype), count=int(np.prod(shape)), offset=offset
+            ).reshape(shape)
+            for name, (offset, dtype, shape) in header["sections"].items()
+        }
+        self.count, self.dimension = self._sections["codes"].shape
+
+    def search(
+        self, query_embedding: list[float], top_k: int, rescore_k: int
+    ) -> tuple[list[int], list[float]]:
+        """
+        Find the nearest rows by squared L2 distance.
+
+        Args:
+            query_embedding (list[float]): The query embedding.
+            top_k (int): The number of rows to return.
+            rescore_k (int): The number of candidates rescored with the float vectors.
+
+        Returns:
+            tuple[list[int], list[float]]: The row numbers and their squared L2 distances,
+                the nearest first.
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        codes = self._sections["codes"]
+        rescore_k = min(max(rescore_k, top_k), self.count)
+
+        approx_dot = np.empty(self.count, dtype=np.float32)
+        for start in range(0, self.count, BLOCK_SIZE):
+            block = codes[start : start + BLOCK_SIZE].astype(np.float32)
+            approx_dot[start : start + BLOCK_SIZE] = block @ query
+        approx_dot *= self._sections["scales"]
+        approx_distances = self._sections["squared_norms"] - 2 * approx_dot
+
+        candidates = np.argpartition(approx_distances, rescore_k - 1)[:rescore_k]
+        candidates.sort()  # sequential reads from the mmap
+        differences = self._sections["vectors"][candidates] - query
+        distances = np.einsum("ij,ij->i", differences, differences)
+
+        order = np.argsort(distances)[:top_k]
+        return candidates[order].tolist(), distances[order].tolist()
+
+    def get_node(self, row: int) -> BaseNode:
+        metadata = json.loads(self._get_string("metadatas", row))
+        node = metadata_dict_to_node(metadata, text=self._get_string("texts", row))
+        node.id_ = self._get_string("ids", row)
+        return node
+
+    def get_id(self, row: int) -> str:
+        return self._get_string("ids", row)
+
+    def get_vectors(self) -> np.ndarray:
+        return self._sections["vectors"]
+
+    def _get_string(self, name: str, row: int) -> str:
+        offsets = self._sections[f"{name}_offsets"]
+        return self._sections[name][offsets[row] : offsets[row + 1]].tobytes().decode("utf-8")
+
+
+class SnapshotVectorStore(BasePydanticVectorStore):
+    """Read-only vector store over a snapshot."""
+
+    stores_text: bool = True
+    rescore_factor: int = 4
+
+    _snapshot: Snapshot = PrivateAttr()
+
+    def __init__(self, snapshot: Snapshot, rescore_factor: int = 4):
+        super().__init__(rescore_factor=rescore_factor)
+        self._snapshot = snapshot
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "SnapshotVectorStore"
+
+    @property
+    def client(self) -> Snapshot:
+        return self._snapshot
+
+    def add(self, nodes: list[BaseNode], **add_kwargs) -> list[str]:
+        raise NotImplementedError("Snapshots are read-only, rebuild the index instead")
+
+    def delete(self, ref_doc_id: str, **delete_kwargs) -> None:
+        raise NotImplementedError("Snapshots are read-only, rebuild the index instead")
+
+    async def aquery(self, query: VectorStoreQuery, **kwargs) -> VectorStoreQueryResult:
+        # the search takes milliseconds of CPU, so it runs off the event loop
+        return await asyncio.to_thread(self.query, query, **kwargs)
+
+    def query(self, query: VectorStoreQuery, **kwargs) -> VectorStoreQueryResult:
+        if query.filters is not None:
+            raise NotImplementedError("Metadata filters are not supported by snapshots")
+
+        rows, distances = self._snapshot.search(
+            query.query_embedding,
+            query.similarity_top_k,
+            query.similarity_top_k * self.rescore_factor,
+        )
+
+        return VectorStoreQueryResult(
+            nodes=[self._snapshot.get_node(row) for row in rows],
+            # the same conversion as ChromaVectorStore, so score thresholds carry over
+            similarities=[float(np.exp(-distance)) for distance in distances],
+            ids=[self._snapshot.get_id(row) for row in rows],
+        )
+
+
+def _pack_strings(values: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    encoded = [(value or "").encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    offsets[1:] = np.cumsum([len(value) for value in encoded])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+def _write_sections(path: str, sections: dict[str, np.ndarray], header: dict) -> None:
+    # offsets depend on the header length, which depends on the offsets;
+    # reserve a fixed-width header so that one pass is enough
+    header_length = 64 * 1024
+    offset = _align(len(MAGIC) + 8 + header_length)
+    layout = {}
+    for name, values in sections.items():
+        layout[name] = (offset, values.dtype.str, list(values.shape))
+        offset = _align(offset + values.nbytes)
+
+    encoded_header = json.dumps({**header, "sections": layout}, ensure_ascii=False).encode("utf-8")
+    if len(encoded_header) > header_length:
+        raise ValueError("The snapshot header is too large")
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(MAGIC)
+        file.write(struct.pack("<Q", len(encoded_header)))
+        file.write(encoded_header)
+        for name, values in sections.items():
+            file.seek(layout[name][0])
+            file.write(np.ascontiguousarray(values).tobytes())
+        # every section, even an empty last one, lies within the file
+        file.truncate(offset)
+    os.replace(tmp_path, path)
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
@@ -0,0 +1,159 @@
+"""
+Compare serving the FAQ collection from Chroma and from its quantized snapshot.
+
+Each format is loaded in a fresh process to measure its load time and resident memory. Queries
+are stored vectors with small noise added, so the benchmark runs offline, and recall@k is
+measured against an exact float search.
+
+Usage:
+    python -m app.data.snapshot_bench --queries 200
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import time
+
+import numpy as np
+
+from app.core.config import settings
+from app.data.snapshot import Snapshot, get_snapshot_path
+from app.data.versions import get_current_version, get_version_path
+
+
+def _get_rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm", "r") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # peak rather than current, in kilobytes on Linux and bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _bench_chroma(
+    db_path: str, collection_name: str, queries: list[list[float]], top_k: int
+) -> dict:
+    import chromadb
+
+    rss_before = _get_rss_bytes()
+    start_time = time.perf_counter()
+    collection = chromadb.PersistentClient(path=db_path).get_collection(collection_name)
+    # the HNSW index is loaded by the first query
+    collection.query(query_embeddings=queries[:1], n_results=top_k)
+    load_seconds = time.perf_counter() - start_time
+
+    ids, latencies = [], []
+    for query in queries:
+        start_time = time.perf_counter()
+        result = collection.query(query_embeddings=[query], n_results=top_k)
+        latencies.append(time.perf_counter() - start_time)
+        ids.append(result["ids"][0])
+
+    return {
+        "load_seconds": load_seconds,
+        "rss_bytes": _get_rss_bytes() - rss_before,
+        "latencies": latencies,
+        "ids": ids,
+    }
+
+
+def _bench_snapshot(
+    snapshot_path: str, queries: list[list[float]], top_k: int, rescore_factor: int
+) -> dict:
+    rss_before = _get_rss_bytes()
+    start_time = time.perf_counter()
+    snapshot = Snapshot(snapshot_path)
+    snapshot.search(queries[0], top_k, top_k * rescore_factor)
+    load_seconds = time.perf_counter() - start_time
+
+    ids, latencies = [], []
+    for query in queries:
+        start_time = time.perf_counter()
+        rows, _ = snapshot.search(query, top_k, top_k * rescore_factor)
+        latencies.append(time.perf_counter() - start_time)
+        ids.append([snapshot.get_id(row) for row in rows])
+
+    return {
+        "load_seconds": load_seconds,
+        "rss_bytes": _get_rss_bytes() - rss_before,
+        "latencies": latencies,
+        "ids": ids,
+    }
+
+
+def _make_queries(snapshot: Snapshot, num_queries: int, noise: float) -> list[list[float]]:
+    rng = np.random.default_rng(0)
+    vectors = snapshot.get_vectors()
+
+    rows = rng.choice(snapshot.count, size=min(num_queries, snapshot.count), replace=False)
+    queries = vectors[rows] + rng.normal(scale=noise, size=(len(rows), snapshot.dimension))
+    queries = (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+    return queries.tolist()
+
+
+def _get_exact_ids(snapshot: Snapshot, queries: list[list[float]], top_k: int) -> list[list[str]]:
+    vectors = snapshot.get_vectors()
+    exact_ids = []
+    for query in queries:
+        differences = vectors - np.asarray(query, dtype=np.float32)
+        distances = np.einsum("ij,ij->i", differences, differences)
+        exact_ids.append([snapshot.get_id(row) for row in np.argsort(distances)[:top_k]])
+    return exact_ids
+
+
+def _get_recall(ids: list[list[str]], exact_ids: list[list[str]]) -> float:
+    return float(np.mean([len(set(a) & set(e)) / len(e) for a, e in zip(ids, exact_ids)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--db-path", help="Defaults to the current index version")
+    parser.add_argument("--collection-name", default=settings.COLLECTION_NAME)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.01)
+    parser.add_argument("--top-k", type=int, default=settings.TOP_K)
+    parser.add_argument("--rescore-factor", type=int, default=settings.SNAPSHOT_RESCORE_FACTOR)
+    args = parser.parse_args()
+
+    db_path = args.db_path
+    if db_path is None:
+        version = get_current_version(settings.DB_PATH)
+        if version is None:
+            raise ValueError(f"Database not found at {settings.DB_PATH}")
+        db_path = get_version_path(settings.DB_PATH, version)
+
+    snapshot_path = get_snapshot_path(db_path, args.collection_name)
+    snapshot = Snapshot(snapshot_path)
+    queries = _make_queries(snapshot, args.queries, args.noise)
+    exact_ids = _get_exact_ids(snapshot, queries, args.top_k)
+    del snapshot
+
+    # a fresh process per format, so that neither sees the other's memory
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        results = {
+            "chroma": pool.apply(
+                _bench_chroma, (db_path, args.collection_name, queries, args.top_k)
+            ),
+            "snapshot": pool.apply(
+                _bench_snapshot, (snapshot_path, queries, args.top_k, args.rescore_factor)
+            ),
+        }
+
+    header = f"{'format':>10} {'load ms':>10} {'rss MiB':>10} {'p50 ms':>8} {'p95 ms':>8}"
+    print(f"{header} {'recall':>8}")
+    for name, result in results.items():
+        latencies = np.asarray(result["latencies"]) * 1000
+        print(
+            f"{name:>10} {result['load_seconds'] * 1000:>10.1f} "
+            f"{result['rss_bytes'] / 2**20:>10.1f} "
+            f"{np.percentile(latencies, 50):>8.2f} {np.percentile(latencies, 95):>8.2f} "
+            f"{_get_recall(result['ids'], exact_ids):>8.3f}"
+        )
+    print(f"\nrecall@{args.top_k} against an exact float search over {len(queries)} queries")
+
+
+if __name__ == "__main__":
+    main()
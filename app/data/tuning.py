@@ -0,0 +1,353 @@
+"""
+Evaluate retrieval under a grid of chunking and top-k settings.
+
+Temporary indexes are built from the FAQ pkl file with a deterministic local embedding, so the
+harness runs offline. The labelled question set is a jsonl file whose lines look like
+`{"question": "...", "relevant_questions": ["<FAQ question>", ...]}`.
+
+With `--calibrate-precomputed`, the same question set instead calibrates
+PRECOMPUTED_SIMILARITY_THRESHOLD. This embeds the FAQ with the configured embedding model,
+since cosine similarities are not comparable across models.
+
+Usage:
+    python -m app.data.tuning --questions labelled_questions.jsonl
+    python -m app.data.tuning --questions labelled_questions.jsonl --calibrate-precomputed
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import tempfile
+import time
+from dataclasses import dataclass
+
+import chromadb
+import numpy as np
+from llama_index.core import Document, StorageContext, VectorStoreIndex
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import MetadataMode
+from llama_index.core.utils import get_tokenizer
+from llama_index.core.vector_stores import VectorStoreQuery
+from llama_index.vector_stores.chroma import ChromaVectorStore
+
+from app.core.config import settings
+from app.core.embedding import HashingEmbedding, get_embed_model
+from app.chat.precomputed import get_cosine_similarity
+from app.data.etl import _load_raw_data, _preprocess_raw_data
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LabelledQuestion:
+    question: str
+    relevant_hashes: set[str]
+
+
+@dataclass
+class EvaluationResult:
+    chunk_size: int
+    chunk_overlap: int
+    top_k: int
+    recall: float
+    mrr: float
+    context_tokens: float
+    latency_ms: float
+
+    def dominates(self, other: "EvaluationResult") -> bool:
+        # latency is reported but not an objective: it is noisy, and the search takes
+        # far less time than the LLM calls
+        not_worse = (
+            self.recall >= other.recall
+            and self.mrr >= other.mrr
+            and self.context_tokens <= other.context_tokens
+        )
+        better = (
+            self.recall > other.recall
+            or self.mrr > other.mrr
+            or self.context_tokens < other.context_tokens
+        )
+        return not_worse and better
+
+
+def evaluate_grid(
+    documents: list[Document],
+    questions: list[LabelledQuestion],
+    chunk_sizes: list[int],
+    chunk_overlaps: list[int],
+    top_ks: list[int],
+) -> list[EvaluationResult]:
+    """
+    Evaluate every combination of the given settings.
+
+    Args:
+        documents (list[Document]): The preprocessed FAQ documents.
+        questions (list[LabelledQuestion]): The labelled question set.
+        chunk_sizes (list[int]): The chunk sizes to try.
+        chunk_overlaps (list[int]): The chunk overlaps to try. Overlaps not smaller than
+            the chunk size are skipped.
+        top_ks (list[int]): The numbers of retrieved nodes to try.
+
+    Returns:
+        list[EvaluationResult]: The metrics per configuration.
+    """
+    embed_model = HashingEmbedding()
+    tokenizer = get_tokenizer()
+    results = []
+
+    # the questions do not depend on the chunking, so they are embedded once
+    question_embeddings = [embed_model.get_query_embedding(q.question) for q in questions]
+
+    for chunk_size, chunk_overlap in itertools.product(chunk_sizes, chunk_overlaps):
+        if chunk_overlap >= chunk_size:
+            continue
+
+        with tempfile.TemporaryDirectory() as db_path:
+            index = _build_index(db_path, documents, embed_model, chunk_size, chunk_overlap)
+
+            for top_k in top_ks:
+                result = _evaluate_index(
+                    index,
+                    questions,
+                    question_embeddings,
+                    chunk_size,
+                    chunk_overlap,
+                    top_k,
+                    tokenizer,
+                )
+                logger.info(result)
+                results.append(result)
+
+    return results
+
+
+def get_pareto_front(results: list[EvaluationResult]) -> list[EvaluationResult]:
+    """
+    Returns the configurations that no other configuration beats on every metric.
+    """
+    return [
+        result
+        for result in results
+        if not any(other.dominates(result) for other in results if other is not result)
+    ]
+
+
+def recommend(pareto_front: list[EvaluationResult], recall_tolerance: float) -> EvaluationResult:
+    """
+    Returns the Pareto-optimal configuration with the fewest context tokens among those whose
+    recall is within `recall_tolerance` of the best recall. Recall only grows with top-k, so
+    preferring the best recall alone would always pick the largest top-k.
+    """
+    best_recall = max(result.recall for result in pareto_front)
+    candidates = [
+        result for result in pareto_front if result.recall >= best_recall - recall_tolerance
+    ]
+    return min(candidates, key=lambda result: (result.context_tokens, -result.recall))
+
+
+def calibrate_precomputed_threshold(
+    documents: list[Document],
+    questions: list[LabelledQuestion],
+    embed_model: BaseEmbedding,
+    target_precision: float,
+) -> tuple[float | None, float]:
+    """
+    Find the lowest cosine similarity of the top retrieved node above which its precomputed
+    answer is the right one for at least `target_precision` of the served questions.
+
+    Args:
+        documents (list[Document]): The preprocessed FAQ documents.
+        questions (list[LabelledQuestion]): The labelled question set.
+        embed_model (BaseEmbedding): The embedding model the service uses.
+        target_precision (float): The share of served answers that must be right.
+
+    Returns:
+        tuple[float | None, float]: The threshold, or None if the precision is never reached,
+            and the share of the questions it serves.
+    """
+    with tempfile.TemporaryDirectory() as db_path:
+        index = _build_index(
+            db_path, documents, embed_model, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP
+        )
+        retriever = index.as_retriever(similarity_top_k=1)
+
+        matches = []
+        for question in questions:
+            nodes = retriever.retrieve(question.question)
+            if nodes:
+                is_right = nodes[0].node.metadata.get("content_hash") in question.relevant_hashes
+                matches.append((get_cosine_similarity(nodes[0].score), is_right))
+
+    # lower the threshold one question at a time, from the most similar one
+    matches.sort(key=lambda match: match[0], reverse=True)
+    threshold, coverage, num_right = None, 0.0, 0
+    for num_served, (similarity, is_right) in enumerate(matches, start=1):
+        num_right += is_right
+        if num_right / num_served >= target_precision:
+            threshold, coverage = similarity, num_served / len(questions)
+
+    return threshold, coverage
+
+
+def _build_index(
+    db_path: str,
+    documents: list[Document],
+    embed_model: BaseEmbedding,
+    chunk_size: int,
+    chunk_overlap: int,
+) -> VectorStoreIndex:
+    node_parser = SentenceSplitter.from_defaults(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    nodes = node_parser.get_nodes_from_documents(documents)
+
+    client = chromadb.PersistentClient(path=db_path)
+    chroma_collection = client.create_collection(settings.COLLECTION_NAME)
+    vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
+    storage_context = StorageContext.from_defaults(vector_store=vector_store)
+
+    return VectorStoreIndex(nodes, storage_context=storage_context, embed_model=embed_model)
+
+
+def _evaluate_index(
+    index: VectorStoreIndex,
+    questions: list[LabelledQuestion],
+    question_embeddings: list[list[float]],
+    chunk_size: int,
+    chunk_overlap: int,
+    top_k: int,
+    tokenizer,
+) -> EvaluationResult:
+    recalls, reciprocal_ranks, context_tokens, latencies = [], [], [], []
+    for question, question_embedding in zip(questions, question_embeddings):
+        query = VectorStoreQuery(query_embedding=question_embedding, similarity_top_k=top_k)
+
+        # time the search only, since the embedding does not depend on the settings
+        start_time = time.perf_counter()
+        nodes = index.vector_store.query(query).nodes or []
+        latencies.append((time.perf_counter() - start_time) * 1000)
+
+        retrieved_hashes = [node.metadata.get("content_hash") for node in nodes]
+        recalls.append(
+            len(question.relevant_hashes & set(retrieved_hashes)) / len(question.relevant_hashes)
+        )
+        reciprocal_ranks.append(
+            next(
+                (
+                    1 / rank
+                    for rank, content_hash in enumerate(retrieved_hashes, start=1)
+                    if content_hash in question.relevant_hashes
+                ),
+                0.0,
+            )
+        )
+        context_tokens.append(
+            sum(len(tokenizer(node.get_content(metadata_mode=MetadataMode.LLM))) for node in nodes)
+        )
+
+    return EvaluationResult(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        top_k=top_k,
+        recall=float(np.mean(recalls)),
+        mrr=float(np.mean(reciprocal_ranks)),
+        context_tokens=float(np.mean(context_tokens)),
+        latency_ms=float(np.percentile(latencies, 95)),
+    )
+
+
+def _load_labelled_questions(
+    questions_path: str, documents: list[Document]
+) -> list[LabelledQuestion]:
+    hashes_by_question = {
+        document.metadata["question"]: document.metadata["content_hash"] for document in documents
+    }
+
+    questions = []
+    with open(questions_path, "r", encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            relevant_hashes = {
+                hashes_by_question[q]
+                for q in record["relevant_questions"]
+                if q in hashes_by_question
+            }
+            if not relevant_hashes:
+                logger.warning(f"No FAQ entry found for the question: {record['question']}")
+                continue
+            questions.append(LabelledQuestion(record["question"], relevant_hashes))
+
+    return questions
+
+
+def _print_results(
+    results: list[EvaluationResult],
+    pareto_front: list[EvaluationResult],
+    recall_tolerance: float,
+) -> None:
+    header = f"{'size':>6} {'overlap':>8} {'top_k':>6} {'recall':>8} {'mrr':>8}"
+    print(f"{header} {'tokens':>8} {'p95 ms':>8}")
+    for result in results:
+        marker = " *" if result in pareto_front else ""
+        print(
+            f"{result.chunk_size:>6} {result.chunk_overlap:>8} {result.top_k:>6} "
+            f"{result.recall:>8.3f} {result.mrr:>8.3f} {result.context_tokens:>8.1f} "
+            f"{result.latency_ms:>8.2f}{marker}"
+        )
+
+    recommended = recommend(pareto_front, recall_tolerance)
+    print("\n* Pareto-optimal on recall, MRR and context tokens")
+    print(
+        f"Recommended, the fewest tokens within {recall_tolerance} of the best recall: "
+        f"CHUNK_SIZE={recommended.chunk_size}, "
+        f"CHUNK_OVERLAP={recommended.chunk_overlap}, TOP_K={recommended.top_k}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--questions", required=True, help="Path to the labelled question set")
+    parser.add_argument("--pkl-path", default=settings.PKL_PATH)
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[256, 512, 1024])
+    parser.add_argument("--chunk-overlaps", type=int, nargs="+", default=[0, 64, 128])
+    parser.add_argument("--top-ks", type=int, nargs="+", default=[1, 3, 5, 10])
+    parser.add_argument(
+        "--recall-tolerance",
+        type=float,
+        default=0.02,
+        help="Recall the recommended setting may give up to save context tokens",
+    )
+    parser.add_argument("--calibrate-precomputed", action="store_true")
+    parser.add_argument(
+        "--target-precision",
+        type=float,
+        default=0.95,
+        help="Share of precomputed answers that must match the question",
+    )
+    args = parser.parse_args()
+
+    documents = _preprocess_raw_data(_load_raw_data(args.pkl_path))
+    questions = _load_labelled_questions(args.questions, documents)
+    if not questions:
+        raise ValueError(f"No usable labelled questions in {args.questions}")
+
+    if args.calibrate_precomputed:
+        threshold, coverage = calibrate_precomputed_threshold(
+            documents, questions, get_embed_model(), args.target_precision
+        )
+        if threshold is None:
+            print(f"No threshold reaches a precision of {args.target_precision}")
+        else:
+            print(f"PRECOMPUTED_SIMILARITY_THRESHOLD={threshold:.3f} serves {coverage:.1%}")
+        return
+
+    results = evaluate_grid(
+        documents, questions, args.chunk_sizes, args.chunk_overlaps, args.top_ks
+    )
+    _print_results(results, get_pareto_front(results), args.recall_tolerance)
+
+
+if __name__ == "__main__":
+    main()
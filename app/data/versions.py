@@ -0,0 +1,182 @@
+"""
+Versioned index directories under `DB_PATH`:
+
+    {DB_PATH}/versions/{version}/   a complete Chroma database
+    {DB_PATH}/CURRENT               the name of the version to serve, replaced atomically
+    {DB_PATH}/workers/{pid}         the versions a worker still serves requests from
+    {DB_PATH}/BUILD.lock            held by the build in progress, so that builds run one at a time
+
+Versions are named by their build time in microseconds, so they sort in the order they were
+built, and their directory is created exclusively, so concurrent builds never share one.
+"""
+
+import fcntl
+import logging
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+# A database created before versioning, located at `DB_PATH` itself
+LEGACY_VERSION = "legacy"
+
+
+@contextmanager
+def build_lock(db_path: str, blocking: bool = True) -> Iterator[bool]:
+    """
+    Hold the build lock, waiting for the build in progress unless `blocking` is False. A build
+    holds it from creating its version until the unused versions are removed, so that a faster
+    concurrent build never removes a version that is still being built.
+
+    Yields:
+        bool: Whether the lock was acquired, which is always the case when blocking.
+    """
+    os.makedirs(db_path, exist_ok=True)
+    with open(os.path.join(db_path, "BUILD.lock"), "a") as file:
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+
+        try:
+            yield True
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def new_version(db_path: str) -> str:
+    """
+    Create the directory of a new version and return its name.
+    """
+    versions_path = os.path.join(db_path, "versions")
+    os.makedirs(versions_path, exist_ok=True)
+
+    while True:
+        now = time.time()
+        version = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now % 1 * 1e6):06d}"
+        try:
+            os.mkdir(os.path.join(versions_path, version))
+            return version
+        except FileExistsError:
+            # another build started within the same microsecond
+            continue
+
+
+def get_version_path(db_path: str, version: str) -> str:
+    if version == LEGACY_VERSION:
+        return db_path
+    return os.path.join(db_path, "versions", version)
+
+
+def get_current_version(db_path: str) -> str | None:
+    """
+    Returns the version to serve, or None if no index has been built yet.
+    """
+    current_path = os.path.join(db_path, "CURRENT")
+    if os.path.exists(current_path):
+        with open(current_path, "r") as file:
+            return file.read().strip()
+
+    if os.path.exists(os.path.join(db_path, "chroma.sqlite3")):
+        return LEGACY_VERSION
+
+    return None
+
+
+def set_current_version(db_path: str, version: str) -> None:
+    _write_atomically(os.path.join(db_path, "CURRENT"), version)
+    logger.info(f"Set the current index version to {version}")
+
+
+def register_worker_versions(db_path: str, versions: set[str]) -> None:
+    """
+    Record the versions this worker serves, so that they are not garbage-collected.
+    """
+    workers_path = os.path.join(db_path, "workers")
+    os.makedirs(workers_path, exist_ok=True)
+    _write_atomically(os.path.join(workers_path, str(os.getpid())), "\n".join(sorted(versions)))
+
+
+def unregister_worker(db_path: str) -> None:
+    worker_path = os.path.join(db_path, "workers", str(os.getpid()))
+    if os.path.exists(worker_path):
+        os.remove(worker_path)
+
+
+def remove_unused_versions(db_path: str, locked: bool = False) -> None:
+    """
+    Remove the versions older than the current one that no live worker serves.
+    Newer versions are left alone, since they may still be being built.
+
+    Args:
+        db_path (str): The directory holding the index versions.
+        locked (bool): Whether the caller holds the build lock. Otherwise nothing is removed
+            while a build is in progress; the build removes the unused versions when it ends.
+    """
+    if locked:
+        _remove_unused_versions(db_path)
+        return
+
+    with build_lock(db_path, blocking=False) as acquired:
+        if not acquired:
+            logger.debug("Skip removing the unused index versions during a build")
+            return
+        _remove_unused_versions(db_path)
+
+
+def _remove_unused_versions(db_path: str) -> None:
+    current_version = get_current_version(db_path)
+    versions_path = os.path.join(db_path, "versions")
+    if current_version is None or not os.path.exists(versions_path):
+        return
+
+    versions_in_use = _get_live_worker_versions(db_path) | {current_version}
+
+    for version in os.listdir(versions_path):
+        if version >= current_version or version in versions_in_use:
+            continue
+
+        shutil.rmtree(os.path.join(versions_path, version), ignore_errors=True)
+        logger.info(f"Removed the unused index version {version}")
+
+
+def _get_live_worker_versions(db_path: str) -> set[str]:
+    workers_path = os.path.join(db_path, "workers")
+    if not os.path.exists(workers_path):
+        return set()
+
+    versions = set()
+    for pid in os.listdir(workers_path):
+        if not pid.isdigit():
+            # a marker being written
+            continue
+
+        worker_path = os.path.join(workers_path, pid)
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            # the worker is gone
+            if os.path.exists(worker_path):
+                os.remove(worker_path)
+            continue
+        except PermissionError:
+            pass
+
+        try:
+            with open(worker_path, "r") as file:
+                versions.update(line.strip() for line in file if line.strip())
+        except FileNotFoundError:
+            continue
+
+    return versions
+
+
+def _write_atomically(path: str, content: str) -> None:
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        file.write(content)
+    os.replace(tmp_path, path)
@@ -1,11 +1,15 @@
+import asyncio
 import logging
 import sys
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 import uvicorn
 
 from app.api import api_router
 from app.core import settings
+from app.chat.index_manager import index_manager
+from app.chat.query_log import start_query_log, stop_query_log
 from app.data.etl import extract_transform_load
 
 logger = logging.getLogger(__name__)
@@ -23,11 +27,26 @@ def __setup_logging(log_level: str):
     logger.info(f"Set up logging with log level {log_level}")
 
 
-def __setup_db(pkl_path: str, db_path: str, collection_name: str):
-    extract_transform_load(pkl_path, db_path, collection_name)
+def __setup_db(corpora: dict[str, str], db_path: str):
+    extract_transform_load(corpora, db_path)
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # load and warm the default collection before serving, then keep watching for new versions;
+    # the other collections are loaded on their first request
+    await index_manager.preload(settings.COLLECTION_NAME)
+    watcher = asyncio.create_task(index_manager.watch(settings.INDEX_WATCH_INTERVAL_SECONDS))
+    start_query_log()
+
+    yield
+
+    stop_query_log()
+    watcher.cancel()
+    index_manager.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(api_router, prefix=settings.API_PREFIX)
 
@@ -38,7 +57,7 @@ def start():
     print("Running in AppEnvironment: " + settings.ENVIRONMENT.value)
 
     __setup_logging(settings.LOG_LEVEL)
-    __setup_db(settings.PKL_PATH, settings.DB_PATH, settings.COLLECTION_NAME)
+    __setup_db(settings.CORPORA, settings.DB_PATH)
 
     live_reload = not settings.RENDER
 
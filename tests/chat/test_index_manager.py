@@ -0,0 +1,101 @@
+import asyncio
+import os
+
+import app.chat.index_manager as index_manager_module
+from app.chat.index_manager import IndexManager
+from app.data.versions import (
+    _get_live_worker_versions,
+    get_version_path,
+    new_version,
+    set_current_version,
+)
+
+
+class FakeIndex:
+    def __init__(self, db_path: str, collection_name: str):
+        self.db_path = db_path
+        self.collection_name = collection_name
+
+
+def _patch_engine(monkeypatch, db_path: str) -> list[str]:
+    released_paths = []
+
+    def load_index_from_db(version_path, collection_name, warm_up=False):
+        # the version must be protected from removal while it is loaded
+        assert os.path.basename(version_path) in _get_live_worker_versions(db_path)
+        return FakeIndex(version_path, collection_name)
+
+    monkeypatch.setattr(index_manager_module, "load_index_from_db", load_index_from_db)
+    monkeypatch.setattr(index_manager_module, "estimate_index_bytes", lambda index: 1)
+    monkeypatch.setattr(index_manager_module, "release_db", released_paths.append)
+    return released_paths
+
+
+async def _wait_for(condition) -> None:
+    for _ in range(500):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise TimeoutError
+
+
+def test_lease_keeps_the_old_version_until_released(tmp_path, monkeypatch):
+    db_path = str(tmp_path)
+    released_paths = _patch_engine(monkeypatch, db_path)
+    old_version = new_version(db_path)
+    set_current_version(db_path, old_version)
+
+    async def run():
+        manager = IndexManager(db_path, memory_budget_bytes=10)
+        await manager.preload("qna")
+        watcher = asyncio.create_task(manager.watch(interval=0.01))
+
+        try:
+            async with manager.lease("qna") as (leased_version, index):
+                assert leased_version == old_version
+                assert index.db_path == get_version_path(db_path, old_version)
+
+                version = new_version(db_path)
+                set_current_version(db_path, version)
+                await _wait_for(lambda: manager.version == version)
+
+                # the request in flight still holds the old version
+                await asyncio.sleep(0.05)
+                assert old_version in _get_live_worker_versions(db_path)
+                assert os.path.exists(get_version_path(db_path, old_version))
+                assert released_paths == []
+
+            async with manager.lease("qna") as (leased_version, index):
+                assert leased_version == version
+                assert index.db_path == get_version_path(db_path, version)
+
+            await _wait_for(lambda: released_paths)
+            assert released_paths == [get_version_path(db_path, old_version)]
+            assert _get_live_worker_versions(db_path) == {version}
+            assert not os.path.exists(get_version_path(db_path, old_version))
+        finally:
+            watcher.cancel()
+            manager.close()
+
+        assert _get_live_worker_versions(db_path) == set()
+
+    asyncio.run(run())
+
+
+def test_idle_collections_are_evicted_beyond_the_budget(tmp_path, monkeypatch):
+    db_path = str(tmp_path)
+    _patch_engine(monkeypatch, db_path)
+    set_current_version(db_path, new_version(db_path))
+
+    async def run():
+        manager = IndexManager(db_path, memory_budget_bytes=2)
+        try:
+            async with manager.lease("a"):
+                await manager.preload("b")
+                await manager.preload("c")
+                # "a" is leased, so the least recently used idle one goes
+                assert sorted(manager.collection_names) == ["a", "c"]
+        finally:
+            manager.close()
+
+    asyncio.run(run())
@@ -0,0 +1,47 @@
+import json
+import math
+
+import numpy as np
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from app.core.config import settings
+from app.chat.precomputed import (
+    find_precomputed_answer,
+    get_cosine_similarity,
+    load_precomputed_answers,
+)
+
+ANSWERS = {"hash-a": {"question": "질문 a", "answer": "대답 a"}}
+
+
+def _get_nodes(cosine: float, content_hash: str) -> list[NodeWithScore]:
+    # the score the vector stores give unit-norm embeddings at this cosine similarity
+    score = math.exp(-(2 - 2 * cosine))
+    return [NodeWithScore(node=TextNode(metadata={"content_hash": content_hash}), score=score)]
+
+
+def test_get_cosine_similarity():
+    rng = np.random.default_rng(0)
+    a, b = rng.normal(size=(2, 16))
+    a, b = a / np.linalg.norm(a), b / np.linalg.norm(b)
+    score = math.exp(-float(np.sum((a - b) ** 2)))
+
+    assert math.isclose(get_cosine_similarity(score), float(a @ b), abs_tol=1e-9)
+    assert get_cosine_similarity(1.0) == 1.0
+
+
+def test_find_precomputed_answer(monkeypatch):
+    monkeypatch.setattr(settings, "PRECOMPUTED_SIMILARITY_THRESHOLD", 0.9)
+
+    assert find_precomputed_answer(_get_nodes(0.95, "hash-a"), ANSWERS) == "대답 a"
+    assert find_precomputed_answer(_get_nodes(0.85, "hash-a"), ANSWERS) is None
+    assert find_precomputed_answer(_get_nodes(0.95, "hash-unknown"), ANSWERS) is None
+    assert find_precomputed_answer([], ANSWERS) is None
+
+
+def test_load_precomputed_answers(tmp_path):
+    answers_path = tmp_path / "precomputed_answers.json"
+    assert load_precomputed_answers(str(answers_path)) == {}
+
+    answers_path.write_text(json.dumps(ANSWERS, ensure_ascii=False), encoding="utf-8")
+    assert load_precomputed_answers(str(answers_path)) == ANSWERS
@@ -0,0 +1,114 @@
+import asyncio
+import gc
+from collections import Counter
+
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+
+from app.chat import speculative
+from app.chat.speculative import SpeculativeRetriever, get_hit_rate
+
+USER_MESSAGE = "반품 배송비는 누가 부담하나요?"
+
+
+class FakeRetriever(BaseRetriever):
+    def __init__(self, fail_first: bool = False):
+        super().__init__()
+        self.queries: list[str] = []
+        self._fail_first = fail_first
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        self.queries.append(query_bundle.query_str)
+        if self._fail_first and len(self.queries) == 1:
+            raise RuntimeError("search failed")
+        return [NodeWithScore(node=TextNode(text=query_bundle.query_str), score=1.0)]
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        return self._retrieve(query_bundle)
+
+
+def test_reuses_prefetched_nodes_for_similar_query(monkeypatch):
+    monkeypatch.setattr(speculative, "_stats", Counter())
+    inner = FakeRetriever()
+
+    async def run():
+        retriever = SpeculativeRetriever(inner, USER_MESSAGE, similarity_threshold=0.8)
+        retriever.prefetch()
+        nodes = await retriever.aretrieve("반품 배송비는  누가 부담하나요")
+        retriever.close()
+        return retriever, nodes
+
+    retriever, nodes = asyncio.run(run())
+
+    assert inner.queries == [USER_MESSAGE]
+    assert nodes[0].node.get_content() == USER_MESSAGE
+    assert retriever.speculative_hit is True
+    assert speculative._stats == {"hits": 1}
+
+
+def test_retrieves_again_for_dissimilar_query(monkeypatch):
+    monkeypatch.setattr(speculative, "_stats", Counter())
+    inner = FakeRetriever()
+
+    async def run():
+        retriever = SpeculativeRetriever(inner, USER_MESSAGE, similarity_threshold=0.8)
+        retriever.prefetch()
+        nodes = await retriever.aretrieve("교환 기간")
+        retriever.close()
+        return retriever, nodes
+
+    retriever, nodes = asyncio.run(run())
+
+    assert "교환 기간" in inner.queries
+    assert nodes[0].node.get_content() == "교환 기간"
+    assert retriever.speculative_hit is False
+    assert speculative._stats == {"misses": 1}
+
+
+def test_failed_prefetch_falls_back_to_retrieval(monkeypatch):
+    monkeypatch.setattr(speculative, "_stats", Counter())
+    inner = FakeRetriever(fail_first=True)
+
+    async def run():
+        retriever = SpeculativeRetriever(inner, USER_MESSAGE, similarity_threshold=0.8)
+        retriever.prefetch()
+        nodes = await retriever.aretrieve(USER_MESSAGE)
+        retriever.close()
+        return retriever, nodes
+
+    retriever, nodes = asyncio.run(run())
+
+    assert inner.queries == [USER_MESSAGE, USER_MESSAGE]
+    assert nodes[0].node.get_content() == USER_MESSAGE
+    assert retriever.speculative_hit is False
+    assert speculative._stats == {"misses": 1}
+
+
+def test_close_consumes_failed_prefetch():
+    contexts = []
+
+    async def run():
+        asyncio.get_running_loop().set_exception_handler(
+            lambda loop, context: contexts.append(context)
+        )
+        retriever = SpeculativeRetriever(FakeRetriever(fail_first=True), USER_MESSAGE, 0.8)
+        retriever.prefetch()
+        while not retriever._prefetch_task.done():
+            await asyncio.sleep(0)
+        retriever.close()
+
+        # the never-retrieved warning is reported when the task is collected
+        del retriever
+        gc.collect()
+
+    asyncio.run(run())
+
+    assert contexts == []
+
+
+def test_get_hit_rate(monkeypatch):
+    monkeypatch.setattr(speculative, "_stats", Counter())
+    assert get_hit_rate() is None
+
+    speculative._stats.update(hits=3, misses=1)
+    assert get_hit_rate() == 0.75
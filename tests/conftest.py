@@ -0,0 +1,4 @@
+import os
+
+# the settings require an API key, which no test uses
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
@@ -0,0 +1,18 @@
+import pytest
+from pydantic import ValidationError
+
+from app.core.config import Settings
+
+
+def test_corpora_default_to_the_configured_collection(monkeypatch):
+    monkeypatch.setenv("COLLECTION_NAME", "seller")
+    monkeypatch.setenv("PKL_PATH", "/srv/seller.pkl")
+
+    assert Settings().CORPORA == {"seller": "/srv/seller.pkl"}
+
+
+def test_corpora_must_contain_the_default_collection(monkeypatch):
+    monkeypatch.setenv("CORPORA", '{"seller": "/srv/seller.pkl"}')
+
+    with pytest.raises(ValidationError):
+        Settings()
@@ -0,0 +1,106 @@
+import asyncio
+
+import numpy as np
+import pytest
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.embeddings.openai import OpenAIEmbedding
+
+from app.core.embedding import (
+    CachedEmbedding,
+    HashingEmbedding,
+    LocalEmbedding,
+    check_embedding_metadata,
+)
+
+
+class StubModel:
+    def __init__(self, error: Exception | None = None):
+        self.error = error
+        self.calls = []
+
+    def encode(self, texts, batch_size, normalize_embeddings):
+        self.calls.append(list(texts))
+        if self.error is not None:
+            raise self.error
+        return np.array([[float(len(text)), 1.0] for text in texts])
+
+
+class CountingEmbedding(BaseEmbedding):
+    calls: int = 0
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        self.calls += 1
+        return [float(len(query))]
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        return [float(len(text))]
+
+
+def _get_local_embedding(model: StubModel) -> LocalEmbedding:
+    embed_model = LocalEmbedding(model_name="stub", batch_wait_ms=50, max_batch_size=32)
+    embed_model._model = model
+    return embed_model
+
+
+def test_concurrent_queries_are_embedded_in_one_batch():
+    model = StubModel()
+    embed_model = _get_local_embedding(model)
+    queries = ["a", "bb", "ccc"]
+
+    async def run():
+        return await asyncio.gather(*[embed_model.aget_query_embedding(q) for q in queries])
+
+    embeddings = asyncio.run(run())
+
+    assert model.calls == [queries]
+    assert embeddings == [[1.0, 1.0], [2.0, 1.0], [3.0, 1.0]]
+
+
+def test_encode_error_reaches_every_query():
+    model = StubModel(error=RuntimeError("out of memory"))
+    embed_model = _get_local_embedding(model)
+
+    async def run():
+        return await asyncio.gather(
+            *[embed_model.aget_query_embedding(q) for q in ["a", "b"]], return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+
+    assert len(model.calls) == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_cached_embedding_evicts_the_least_recently_used():
+    inner = CountingEmbedding(model_name="counting")
+    embed_model = CachedEmbedding(inner, max_size=2)
+
+    for query in ["a", "bb", "a", "ccc"]:
+        embed_model.get_query_embedding(query)
+    assert inner.calls == 3
+
+    # "bb" was evicted by "ccc", "a" was kept by its second use
+    embed_model.get_query_embedding("a")
+    assert inner.calls == 3
+    assert embed_model.get_query_embedding("bb") == [2.0]
+    assert inner.calls == 4
+
+
+def test_check_embedding_metadata():
+    embed_model = HashingEmbedding()
+    check_embedding_metadata(
+        {"embedding_model": "hashing", "embedding_dimension": 512}, embed_model
+    )
+
+    with pytest.raises(ValueError):
+        check_embedding_metadata(
+            {"embedding_model": "hashing", "embedding_dimension": 256}, embed_model
+        )
+    # collections without metadata were built with ada-002
+    with pytest.raises(ValueError):
+        check_embedding_metadata(None, embed_model)
+    check_embedding_metadata(None, OpenAIEmbedding(api_key="sk-test"))
+    check_embedding_metadata(None, CachedEmbedding(OpenAIEmbedding(api_key="sk-test")))
@@ -0,0 +1,39 @@
+import threading
+import time
+
+import app.core.profiling as profiling
+from app.core.config import settings
+from app.core.profiling import start_request_profiler
+
+
+def test_lock_is_released_when_the_sampler_fails_to_start(monkeypatch):
+    monkeypatch.setattr(settings, "PROFILING_TOKEN", "token")
+
+    def start(self):
+        raise RuntimeError("can't start new thread")
+
+    monkeypatch.setattr(threading.Thread, "start", start)
+    assert start_request_profiler("token") is None
+    monkeypatch.undo()
+
+    assert not profiling._profiling_lock.locked()
+
+
+def test_profile_is_written(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "PROFILING_TOKEN", "token")
+    monkeypatch.setattr(settings, "PROFILING_DIR", str(tmp_path))
+
+    # non-ASCII tokens are rejected rather than raising
+    assert start_request_profiler("토큰") is None
+
+    profiler = start_request_profiler("token")
+    deadline = time.perf_counter() + 0.3
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+    profiler.stop()
+    profiler._thread.join()
+
+    profiles = list(tmp_path.glob("*.folded"))
+    assert len(profiles) == 1
+    assert "test_profile_is_written" in profiles[0].read_text(encoding="utf-8")
+    assert not profiling._profiling_lock.locked()
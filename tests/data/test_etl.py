@@ -0,0 +1,40 @@
+import json
+
+from llama_index.core import Document
+
+from app.data.etl import _rank_hot_documents, get_content_hash
+
+
+def _get_document(question: str) -> Document:
+    return Document(
+        text=question,
+        metadata={"question": question, "content_hash": get_content_hash(question, "", "")},
+    )
+
+
+def test_rank_hot_documents_by_questions():
+    documents = [_get_document(q) for q in ["a", "b", "c"]]
+
+    hot_documents = _rank_hot_documents(documents, 2, ["c", "unknown", "a", "b"], None)
+
+    assert [document.metadata["question"] for document in hot_documents] == ["c", "a"]
+
+
+def test_rank_hot_documents_by_query_log(tmp_path):
+    documents = [_get_document(q) for q in ["a", "b", "c"]]
+    hashes = {
+        document.metadata["question"]: document.metadata["content_hash"] for document in documents
+    }
+    # the top retrieved entries; a stale hash belongs to an entry that has since changed
+    top_hashes = [hashes["b"], "stale", "stale", "stale", hashes["b"], hashes["a"], hashes["b"]]
+
+    query_log_path = tmp_path / "query.log"
+    with open(f"{query_log_path}.123", "w", encoding="utf-8") as file:
+        for timestamp, content_hash in enumerate(top_hashes):
+            record = {"timestamp": timestamp, "content_hashes": [content_hash, hashes["c"]]}
+            file.write(json.dumps(record) + "\n")
+        file.write(json.dumps({"timestamp": 99, "content_hashes": []}) + "\n")
+
+    hot_documents = _rank_hot_documents(documents, 5, [], str(query_log_path))
+
+    assert [document.metadata["question"] for document in hot_documents] == ["b", "a"]
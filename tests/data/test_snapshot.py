@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+from llama_index.core.schema import MetadataMode, TextNode
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
+
+import app.data.snapshot as snapshot_module
+from app.data.snapshot import Snapshot, export_snapshot
+
+
+class FakeCollection:
+    def __init__(self, records: dict, metadata: dict):
+        self.records = records
+        self.metadata = metadata
+
+    def get(self, include: list[str]) -> dict:
+        return self.records
+
+
+def _export(tmp_path, monkeypatch, ids, vectors, documents, metadatas, metadata=None) -> str:
+    collection = FakeCollection(
+        {
+            "ids": ids,
+            "embeddings": vectors.tolist(),
+            "documents": documents,
+            "metadatas": metadatas,
+        },
+        metadata,
+    )
+
+    class FakeClient:
+        def __init__(self, path: str):
+            pass
+
+        def get_collection(self, name: str) -> FakeCollection:
+            return collection
+
+    monkeypatch.setattr(snapshot_module.chromadb, "PersistentClient", FakeClient)
+    return export_snapshot(str(tmp_path), "qna")
+
+
+def _get_unit_vectors(rng, count: int, dimension: int) -> np.ndarray:
+    vectors = rng.normal(size=(count, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_round_trip(tmp_path, monkeypatch):
+    vectors = _get_unit_vectors(np.random.default_rng(0), 10, 32)
+    nodes = [
+        TextNode(
+            id_=f"node-{i}",
+            text=f"질문: 질문 {i}\n대답: 대답 {i}",
+            metadata={"categories": "정산", "content_hash": f"hash-{i}"},
+        )
+        for i in range(10)
+    ]
+    metadata = {"embedding_model": "text-embedding-ada-002", "embedding_dimension": 32}
+
+    path = _export(
+        tmp_path,
+        monkeypatch,
+        [node.node_id for node in nodes],
+        vectors,
+        [node.get_content(metadata_mode=MetadataMode.NONE) for node in nodes],
+        [node_to_metadata_dict(node, remove_text=True, flat_metadata=True) for node in nodes],
+        metadata,
+    )
+    snapshot = Snapshot(path)
+
+    assert (snapshot.count, snapshot.dimension) == (10, 32)
+    assert snapshot.collection_metadata == metadata
+    np.testing.assert_array_equal(snapshot.get_vectors(), vectors)
+    for row, node in enumerate(nodes):
+        loaded_node = snapshot.get_node(row)
+        assert snapshot.get_id(row) == node.node_id
+        assert loaded_node.node_id == node.node_id
+        assert loaded_node.get_content(metadata_mode=MetadataMode.NONE) == node.text
+        assert loaded_node.metadata == node.metadata
+
+
+def test_search_matches_exact_search(tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    vectors = _get_unit_vectors(rng, 3000, 256)
+    path = _export(
+        tmp_path,
+        monkeypatch,
+        [str(i) for i in range(len(vectors))],
+        vectors,
+        [""] * len(vectors),
+        [{}] * len(vectors),
+    )
+    snapshot = Snapshot(path)
+
+    queries = vectors[rng.choice(len(vectors), size=50, replace=False)]
+    queries = queries + rng.normal(scale=0.05, size=queries.shape).astype(np.float32)
+    recalls = []
+    for query in queries:
+        rows, distances = snapshot.search(query.tolist(), top_k=5, rescore_k=20)
+
+        exact_distances = np.einsum("ij,ij->i", vectors - query, vectors - query)
+        exact_rows = np.argsort(exact_distances)[:5]
+        recalls.append(len(set(rows) & set(exact_rows.tolist())) / 5)
+        # the shortlist is rescored with the float vectors
+        np.testing.assert_allclose(distances, exact_distances[rows], rtol=1e-4)
+        assert distances == sorted(distances)
+
+    assert np.mean(recalls) >= 0.99
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "qna.snapshot"
+    path.write_bytes(b"not a snapshot")
+
+    with pytest.raises(ValueError):
+        Snapshot(str(path))
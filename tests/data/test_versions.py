@@ -0,0 +1,89 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from app.data.versions import (
+    build_lock,
+    get_current_version,
+    get_version_path,
+    new_version,
+    register_worker_versions,
+    remove_unused_versions,
+    set_current_version,
+    unregister_worker,
+)
+
+
+def _get_dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_new_version_is_unique_and_ordered(tmp_path):
+    versions = [new_version(str(tmp_path)) for _ in range(100)]
+
+    assert len(set(versions)) == len(versions)
+    assert versions == sorted(versions)
+    for version in versions:
+        assert os.path.isdir(get_version_path(str(tmp_path), version))
+
+
+def test_remove_unused_versions(tmp_path):
+    db_path = str(tmp_path)
+    old, drained, current, building = [new_version(db_path) for _ in range(4)]
+    set_current_version(db_path, current)
+
+    # a live worker still serves the old version, a dead one served the drained version
+    register_worker_versions(db_path, {old, current})
+    dead_worker_path = os.path.join(db_path, "workers", str(_get_dead_pid()))
+    with open(dead_worker_path, "w") as file:
+        file.write(drained)
+
+    remove_unused_versions(db_path)
+
+    assert os.path.exists(get_version_path(db_path, old))
+    assert not os.path.exists(get_version_path(db_path, drained))
+    assert os.path.exists(get_version_path(db_path, current))
+    assert os.path.exists(get_version_path(db_path, building))
+    assert not os.path.exists(dead_worker_path)
+
+    unregister_worker(db_path)
+    remove_unused_versions(db_path)
+
+    assert not os.path.exists(get_version_path(db_path, old))
+    assert get_current_version(db_path) == current
+
+
+def test_remove_unused_versions_waits_for_builds(tmp_path):
+    db_path = str(tmp_path)
+    old, current = new_version(db_path), new_version(db_path)
+    set_current_version(db_path, current)
+
+    with build_lock(db_path):
+        # a worker does not remove anything while a build is in progress
+        remove_unused_versions(db_path)
+        assert os.path.exists(get_version_path(db_path, old))
+
+        remove_unused_versions(db_path, locked=True)
+        assert not os.path.exists(get_version_path(db_path, old))
+
+
+def test_build_lock_serializes_builds(tmp_path):
+    db_path = str(tmp_path)
+    events = []
+
+    def build():
+        with build_lock(db_path):
+            events.append("second build")
+
+    with build_lock(db_path):
+        thread = threading.Thread(target=build)
+        thread.start()
+        time.sleep(0.1)
+        events.append("first build")
+    thread.join()
+
+    assert events == ["first build", "second build"]